@@ -0,0 +1,71 @@
+"""
+Compare two benchmark result files:
+
+    python -m benchmarks.compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+Prints every numeric measurement with its relative change; latency and memory
+increases above --threshold percent are flagged as regressions.
+"""
+import argparse
+import json
+
+# Bigger is better for these metrics (the last key, without any "@k"): throughput,
+# retrieval quality and agreement with exact search. For everything else (latency,
+# memory, seconds, sizes, error rates) smaller is better.
+HIGHER_IS_BETTER = ("recall", "mrr", "coarse_to_fine_overlap", "exact_overlap", "rescored_overlap")
+HIGHER_IS_BETTER_SUFFIX = "_per_s"
+
+
+def higher_is_better(key):
+    """'retrieval[1000].coarse_to_fine_overlap' -> True, 'results[3].recall@4' -> True, '...p95_ms' -> False"""
+    metric = key.rsplit(".", 1)[-1].split("@", 1)[0]
+    return metric in HIGHER_IS_BETTER or metric.endswith(HIGHER_IS_BETTER_SUFFIX)
+
+
+def flatten(node, prefix=""):
+    """{'retrieval': [{'index_size': 1000, 'p50_ms': 1.2}]} -> {'retrieval[1000].p50_ms': 1.2}"""
+    values = {}
+    if isinstance(node, dict):
+        for key, value in node.items():
+            values.update(flatten(value, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(node, list):
+        for index, item in enumerate(node):
+            label = index
+            if isinstance(item, dict):
+                label = item.get("file", item.get("index_size", item.get("concurrency", index)))
+            values.update(flatten(item, f"{prefix}[{label}]"))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        values[prefix] = node
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{old.get('revision')} -> {new.get('revision')}")
+
+    old_values, new_values = flatten(old), flatten(new)
+    regressions = 0
+    for key in sorted(set(old_values) & set(new_values)):
+        if key.startswith("settings"):
+            continue
+        before, after = old_values[key], new_values[key]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = -change if higher_is_better(key) else change
+        flag = "  REGRESSION" if worse > args.threshold else ""
+        regressions += bool(flag)
+        print(f"{key:60s} {before:>12.3f} {after:>12.3f} {change:+8.1f}%{flag}")
+
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Retrieval quality vs. latency sweep over a gold question set.
+
+    python -m benchmarks.eval_retrieval [--gold benchmarks/gold/udhr.json]
+        [--chunking 500:50 1000:200 1500:300] [--strategy legal recursive] [--k 2 4 8]
+        [--index flat hnsw ivf] [--hybrid 0 0.5] [--embeddings fake|hashing|ollama]
+        [--compression none fp16 int8 pca pca+int8] [--target-recall 0.9]
+
+For every chunking strategy x size x index type x hybrid weight it reports recall@k and MRR
+next to index size, build time and query latency, then names the fastest
+configuration that meets the recall target. Compressed flat indexes (see
+VECTOR_COMPRESSION) also report how much of the exact top-k they find before and
+after re-scoring. Results go to benchmarks/results/.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.run_benchmarks import percentiles, git_revision, RESULTS_DIR
+
+NORMALISE_RE = re.compile(r"[^a-z0-9]+")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalise(text):
+    return " ".join(NORMALISE_RE.sub(" ", text.lower()).split())
+
+
+class BM25:
+    """Small in-memory Okapi BM25 for the hybrid setting"""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1, self.b = k1, b
+        self.docs = [Counter(TOKEN_RE.findall(text.lower())) for text in texts]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = sum(self.lengths) / max(len(self.docs), 1)
+        document_frequency = Counter(term for doc in self.docs for term in doc)
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def search(self, query, k):
+        terms = [term for term in TOKEN_RE.findall(query.lower()) if term in self.idf]
+        scores = []
+        for doc_id, (doc, length) in enumerate(zip(self.docs, self.lengths)):
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (
+                        tf + self.k1 * (1 - self.b + self.b * length / self.avg_length))
+            if score:
+                scores.append((score, doc_id))
+        return [doc_id for _, doc_id in sorted(scores, reverse=True)[:k]]
+
+
+def build_index(index_type, vectors):
+    import faiss
+    import numpy as np
+
+    matrix = np.asarray(vectors, dtype="float32")
+    dim = matrix.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32)
+    elif index_type == "ivf":
+        nlist = max(1, int(math.sqrt(len(matrix))))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(matrix)
+        index.nprobe = min(8, nlist)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    index.add(matrix)
+    return index
+
+
+def reciprocal_rank_fusion(rankings, weights, k, constant=60):
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (constant + rank + 1)
+    return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda item: -item[1])[:k]]
+
+
+def evaluate(chunks, vectors, questions, query_vectors, index_type, hybrid_weight, ks, compression="none"):
+    import faiss
+    import numpy as np
+    from config import RESCORE_OVERSAMPLE
+    from utils.vector_compression import compress_index, parse_compression, rescore
+
+    start = time.perf_counter()
+    index = build_index(index_type, vectors)
+    exact_vectors = None
+    if parse_compression(compression):
+        index, exact_vectors = compress_index(index, compression)
+    bm25 = BM25([chunk.page_content for chunk in chunks]) if hybrid_weight else None
+    build_s = time.perf_counter() - start
+
+    normalised_chunks = [normalise(chunk.page_content) for chunk in chunks]
+    max_k = max(ks)
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks, latencies = [], []
+    raw_overlap, rescored_overlap = [], []
+
+    for question, query_vector in zip(questions, query_vectors):
+        start = time.perf_counter()
+        fetch = max_k * 2 if bm25 else max_k
+        query = np.asarray([query_vector], dtype="float32")
+        if exact_vectors is not None:
+            distances, ids = index.search(query, fetch * RESCORE_OVERSAMPLE)
+            _, positions = rescore(exact_vectors, index.metric_type, query[0], distances[0], ids[0], fetch)
+            ranking = [int(i) for i in positions]
+        else:
+            _, ids = index.search(query, fetch)
+            ranking = [int(i) for i in ids[0] if i >= 0]
+        if bm25:
+            ranking = reciprocal_rank_fusion([ranking, bm25.search(question["question"], fetch)],
+                                             [1 - hybrid_weight, hybrid_weight], max_k)
+        latencies.append(time.perf_counter() - start)
+
+        if exact_vectors is not None and not bm25:
+            exact = set(np.argsort(((exact_vectors - query[0]) ** 2).sum(axis=1), kind="stable")[:max_k].tolist())
+            raw_overlap.append(len(exact.intersection(ids[0][:max_k].tolist())) / len(exact))
+            rescored_overlap.append(len(exact.intersection(ranking[:max_k])) / len(exact))
+
+        expected = normalise(question["expected"])
+        relevant_ranks = [rank for rank, doc_id in enumerate(ranking[:max_k])
+                          if expected in normalised_chunks[doc_id]]
+        first = relevant_ranks[0] if relevant_ranks else None
+        reciprocal_ranks.append(1 / (first + 1) if first is not None else 0.0)
+        for k in ks:
+            hits[k] += first is not None and first < k
+
+    overlap = {}
+    if raw_overlap:
+        overlap = {f"exact_overlap@{max_k}": round(sum(raw_overlap) / len(raw_overlap), 3),
+                   f"rescored_overlap@{max_k}": round(sum(rescored_overlap) / len(rescored_overlap), 3)}
+    return {
+        "index_type": index_type,
+        "compression": compression,
+        "hybrid_weight": hybrid_weight,
+        "build_s": round(build_s, 4),
+        "index_bytes": int(faiss.serialize_index(index).size),
+        **{f"recall@{k}": round(hits[k] / len(questions), 3) for k in ks},
+        **overlap,
+        "mrr": round(sum(reciprocal_ranks) / len(questions), 3),
+        **percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gold", default=os.path.join("benchmarks", "gold", "udhr.json"))
+    parser.add_argument("--chunking", nargs="+", default=["500:50", "1000:200", "1500:300"],
+                        help="chunk_size:chunk_overlap pairs")
+    parser.add_argument("--strategy", nargs="+", default=["legal", "recursive"],
+                        help="chunking strategies (see CHUNKING_STRATEGY)")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--index", nargs="+", default=["flat", "hnsw", "ivf"])
+    parser.add_argument("--hybrid", type=float, nargs="+", default=[0.0, 0.5],
+                        help="BM25 weight in rank fusion (0 = vector only)")
+    parser.add_argument("--embeddings", choices=["fake", "hashing", "ollama"], default="fake")
+    parser.add_argument("--compression", nargs="+", default=["none"],
+                        help="vector compression of flat indexes (see VECTOR_COMPRESSION)")
+    parser.add_argument("--target-recall", type=float, default=0.9, help="recall@k target for the recommendation")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    os.chdir(ROOT_DIR)
+    import vector_database
+
+    with open(args.gold) as f:
+        gold = json.load(f)
+    questions = gold["questions"]
+    pages = vector_database.load_pdf(gold["corpus"])
+    if not pages:
+        raise SystemExit(f"Could not load {gold['corpus']}")
+
+    if args.embeddings == "fake":
+        embeddings = FakeEmbeddings()
+    else:
+        from utils.embeddings import get_embeddings
+        embeddings = get_embeddings(args.embeddings)
+    # Queries go through embed_query, as in the pipeline: some models embed queries differently
+    query_vectors = [embeddings.embed_query(q["question"]) for q in questions]
+
+    results = []
+    settings = [(strategy, setting) for strategy in args.strategy for setting in args.chunking]
+    for strategy, setting in settings:
+        chunk_size, chunk_overlap = (int(value) for value in setting.split(":"))
+        chunks = vector_database.create_chunks(pages, chunk_size, chunk_overlap, strategy)
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks])
+        embed_s = time.perf_counter() - start
+
+        variants = [(index_type, compression) for index_type in args.index
+                    for compression in (args.compression if index_type == "flat" else ["none"])]
+        for index_type, compression in variants:
+            for hybrid_weight in args.hybrid:
+                row = {"strategy": strategy, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "chunks": len(chunks),
+                       "embed_s": round(embed_s, 4),
+                       **evaluate(chunks, vectors, questions, query_vectors, index_type, hybrid_weight, args.k,
+                                  compression)}
+                results.append(row)
+                print(f"{strategy:9} {chunk_size:>5}:{chunk_overlap:<4} {index_type:5} {compression:8} "
+                      f"hybrid={hybrid_weight:<4} "
+                      + " ".join(f"R@{k}={row[f'recall@{k}']:.2f}" for k in args.k)
+                      + f" MRR={row['mrr']:.2f} p50={row['p50_ms']:.2f}ms size={row['index_bytes'] / 1024:.0f}KB")
+
+    # Fastest configuration (by p95 query latency) reaching the target at the smallest k that does
+    recommendation = None
+    for k in sorted(args.k):
+        candidates = [row for row in results if row[f"recall@{k}"] >= args.target_recall]
+        if candidates:
+            best = min(candidates, key=lambda row: (row["p95_ms"], row["index_bytes"]))
+            recommendation = {"k": k, **best}
+            break
+    if recommendation:
+        print(f"\nFastest configuration with recall@{recommendation['k']} >= {args.target_recall}: "
+              f"{recommendation['strategy']} chunks {recommendation['chunk_size']}:{recommendation['chunk_overlap']}, "
+              f"{recommendation['index_type']} index ({recommendation['compression']} vectors), "
+              f"hybrid={recommendation['hybrid_weight']}")
+    else:
+        print(f"\nNo configuration reached recall {args.target_recall}")
+
+    revision = git_revision()
+    output = args.output or os.path.join(RESULTS_DIR, f"eval-{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"revision": revision, "timestamp": datetime.now().isoformat(), "settings": vars(args),
+                   "results": results, "recommendation": recommendation}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
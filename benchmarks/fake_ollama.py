@@ -0,0 +1,150 @@
+"""
+Stand-in Ollama HTTP server for exercising model residency and warm-up offline.
+
+    python -m benchmarks.fake_ollama [--port 11435] [--load-time 3] [--embed-latency 0.01]
+
+then run the app with OLLAMA_BASE_URL=http://localhost:11435. Like Ollama, it
+serves /api/embed, /api/embeddings, /api/ps and /api/tags. A model loads on first
+use, which takes --load-time seconds. It then stays resident for the keep_alive
+of the last request (default 5m), and 0 unloads it at once.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.fakes import FakeEmbeddings
+
+DURATION_RE = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def parse_keep_alive(value, default=300.0):
+    """Seconds a model stays loaded after a request; negative means forever"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = DURATION_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid keep_alive {value!r}")
+    return float(match.group(1)) * UNITS[match.group(2)]
+
+
+class FakeOllama:
+    """Model residency bookkeeping: which models are loaded and until when"""
+
+    def __init__(self, load_time=3.0, embed_latency=0.0):
+        self.load_time = load_time
+        self.embed_latency = embed_latency
+        self.embeddings = FakeEmbeddings()
+        self.expires = {}  # model -> expiry time (inf for keep_alive < 0)
+        self.loads = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def loaded_models(self):
+        now = time.time()
+        with self._lock:
+            for model in [model for model, expiry in self.expires.items() if expiry <= now]:
+                del self.expires[model]
+            return dict(self.expires)
+
+    def use(self, model, keep_alive):
+        """Load the model if it is not resident (slowly, one load at a time), then extend its residency"""
+        with self._lock:
+            self.requests += 1
+            if self.expires.get(model, 0) <= time.time():
+                self.expires.pop(model, None)
+                time.sleep(self.load_time)
+                self.loads += 1
+            seconds = parse_keep_alive(keep_alive)
+            if seconds == 0:
+                self.expires.pop(model, None)
+            else:
+                self.expires[model] = float("inf") if seconds < 0 else time.time() + seconds
+
+    def embed(self, model, texts, keep_alive):
+        self.use(model, keep_alive)
+        if self.embed_latency:
+            time.sleep(self.embed_latency * len(texts))
+        return self.embeddings.embed_documents(texts)
+
+
+def make_handler(ollama):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, body, status=200):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/api/ps":
+                models = [{"name": model, "model": model,
+                           "expires_at": None if expiry == float("inf") else expiry}
+                          for model, expiry in ollama.loaded_models().items()]
+                self._reply({"models": models})
+            elif self.path == "/api/tags":
+                self._reply({"models": [{"name": model, "model": model} for model in ollama.loaded_models()]})
+            else:
+                self._reply({"error": "not found"}, 404)
+
+        def do_POST(self):
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                model = payload["model"]
+                if self.path == "/api/embed":
+                    texts = payload.get("input", "")
+                    texts = [texts] if isinstance(texts, str) else texts
+                    self._reply({"model": model,
+                                 "embeddings": ollama.embed(model, texts, payload.get("keep_alive"))})
+                elif self.path == "/api/embeddings":
+                    vectors = ollama.embed(model, [payload.get("prompt", "")], payload.get("keep_alive"))
+                    self._reply({"embedding": vectors[0]})
+                else:
+                    self._reply({"error": "not found"}, 404)
+            except (KeyError, ValueError) as e:
+                self._reply({"error": str(e)}, 400)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port=0, load_time=3.0, embed_latency=0.0):
+    """Serve in a background thread; returns (server, base URL, FakeOllama state)"""
+    ollama = FakeOllama(load_time, embed_latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(ollama))
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", ollama
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--load-time", type=float, default=3.0, help="seconds to load a model that is not resident")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedded text")
+    args = parser.parse_args()
+
+    server, url, _ = start_server(args.port, args.load_time, args.embed_latency)
+    print(f"Fake Ollama listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
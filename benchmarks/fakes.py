@@ -0,0 +1,129 @@
+"""
+Deterministic offline stand-ins for Ollama, Groq and Gemini so the pipeline can be
+benchmarked without network access or API keys
+"""
+import hashlib
+import math
+import os
+import random
+import re
+import time
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class BackendError(RuntimeError):
+    """Injected failure of a stand-in backend"""
+
+
+def _maybe_fail(error_rate, rng, backend):
+    if error_rate and rng.random() < error_rate:
+        raise BackendError(f"Injected {backend} failure")
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: deterministic, and similar texts get similar vectors"""
+
+    def __init__(self, dim=384, latency=0.0, error_rate=0.0, seed=0):
+        self.dim = dim
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        _maybe_fail(self.error_rate, self._rng, "embedding")
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        _maybe_fail(self.error_rate, self._rng, "embedding")
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers with a short reasoning trace plus the first sentences of the prompt's context"""
+
+    latency: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-legal-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        _maybe_fail(self.error_rate, random.Random(self.seed + self.calls), "chat model")
+
+        prompt = " ".join(str(message.content) for message in messages)
+        context = prompt.split("Legal Context:", 1)[-1].split("Question:", 1)[0]
+        sentences = " ".join(context.split()[:60]) or "No context was provided for this question."
+        content = (f"<think>The user asks a legal question; reviewing {len(context)} characters "
+                   f"of context.</think>\nBased on the provided documents: {sentences}")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+class FakeGemini:
+    """Stands in for GeminiIntegration"""
+
+    def __init__(self, latency=0.0, available=True, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.available = available
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+
+    def is_available(self) -> bool:
+        return self.available
+
+    def generate_response(self, query: str, context: Optional[str] = None) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        _maybe_fail(self.error_rate, self._rng, "gemini")
+        return f"General legal information about: {query}"
+
+
+def fake_summarizer(summary, new_lines, max_tokens):
+    """Stand-in for ConversationSummarizer: keeps the tail of the conversation"""
+    return f"{summary} {new_lines}"[-max_tokens * 4:].strip()
+
+
+def install_fakes(embed_latency=0.0, llm_latency=0.0, gemini_latency=0.0, error_rate=0.0):
+    """
+    Swap the pipeline's Ollama, Groq and Gemini backends for the stand-ins.
+    Returns the installed objects so callers can inspect call counts.
+    """
+    # The real clients validate keys at construction time; offline runs never use them
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+    import vector_database
+    import rag_pipeline
+
+    embeddings = FakeEmbeddings(latency=embed_latency, error_rate=error_rate)
+    chat_model = FakeChatModel(latency=llm_latency, error_rate=error_rate)
+    gemini = FakeGemini(latency=gemini_latency, error_rate=error_rate)
+
+    vector_database.get_embedding_model = lambda: embeddings
+    rag_pipeline._llm_model = chat_model
+    rag_pipeline._gemini = gemini
+    rag_pipeline.query_refiner._llm = chat_model
+    return {"embeddings": embeddings, "chat_model": chat_model, "gemini": gemini}
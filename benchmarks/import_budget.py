@@ -0,0 +1,59 @@
+"""
+Import-time budget check for the app's entry modules.
+
+    python -m benchmarks.import_budget [--module main] [--budget-ms 1500] [--top 15]
+
+Imports the module in a fresh interpreter with `-X importtime`, prints the
+slowest imports by cumulative time and exits non-zero when the total exceeds
+the budget, so a heavy import that creeps back into module scope fails CI.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_imports(module):
+    """(self_us, cumulative_us, name) for every import made while importing module"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us), int(cumulative_us), name[1:].rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", nargs="+", default=["main", "rag_pipeline", "vector_database"])
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="max cumulative import time per module")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.module:
+        rows = measure_imports(module)
+        top_level = [row for row in rows if not row[2].startswith(" ")]
+        total_ms = sum(cumulative for _, cumulative, _ in top_level) / 1000
+        print(f"\n{module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for self_us, cumulative_us, name in sorted(rows, key=lambda row: -row[1])[:args.top]:
+            print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name.strip()}")
+        if total_ms > args.budget_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        raise SystemExit(f"\nOver the import budget: {', '.join(over_budget)}")
+    print("\nAll modules within the import budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+In-process load test of the chat pipeline with concurrent simulated sessions.
+
+    python -m benchmarks.load_driver [--concurrency 1 4 16] [--turns 10]
+        [--embed-latency 0.005] [--llm-latency 0.8] [--error-rate 0.02]
+        [--shared-session]
+
+Each session replays the question corpus through retrieve_docs_with_refinement,
+answer_query_with_fallback and its MemoryManager, against stand-in backends with
+configurable latency and error rates. For every concurrency level it reports
+throughput, tail latency and error rate, and compares per-stage latency with the
+single-session baseline: a stage whose latency grows with concurrency while its
+backend latency stays fixed is waiting on something shared (a lock, a pool, the
+GIL or a file), and is reported as a contention point.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.fakes import install_fakes, fake_summarizer
+from benchmarks.run_benchmarks import QUERIES, percentiles, git_revision, RESULTS_DIR
+
+# Follow-ups exercise the query refiner and its shared thread pool
+FOLLOW_UPS = ["What about it in the case of children?", "And does that also apply to foreigners?"]
+
+# A stage is flagged when its p50 grows by this factor over the single-session run
+CONTENTION_FACTOR = 1.5
+
+
+def run_session(session_no, turns, db, shared_session, latencies, errors, lock):
+    import rag_pipeline
+    from utils.memory_manager import get_memory_manager
+
+    session_id = "user_session" if shared_session else f"load-{session_no}"
+    manager = get_memory_manager(session_id=session_id)
+    manager.summarizer = fake_summarizer
+    corpus = QUERIES + FOLLOW_UPS
+
+    for turn in range(turns):
+        query = corpus[(session_no + turn) % len(corpus)]
+        start = time.perf_counter()
+        try:
+            docs = rag_pipeline.retrieve_docs_with_refinement(query, db, manager)
+            rag_pipeline.answer_query_with_fallback(docs, query, manager)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+
+
+def run_level(concurrency, turns, db, shared_session):
+    from utils import metrics, memory_manager
+
+    metrics.registry.reset()
+    memory_manager._memory_managers.clear()
+    latencies, errors, lock = [], [], threading.Lock()
+    threads = [threading.Thread(target=run_session,
+                                args=(n, turns, db, shared_session, latencies, errors, lock))
+               for n in range(concurrency)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_s = time.perf_counter() - start
+
+    attempted = concurrency * turns
+    result = {
+        "concurrency": concurrency,
+        "turns": attempted,
+        "wall_s": round(wall_s, 3),
+        "throughput_per_s": round(len(latencies) / wall_s, 3),
+        "error_rate": round(len(errors) / attempted, 4),
+        "errors": {name: errors.count(name) for name in set(errors)},
+    }
+    if latencies:
+        result.update(percentiles(latencies))
+    result["stages"] = {row["stage"]: row["p50_ms"] for row in metrics.latency_summary(metrics.registry.snapshot())}
+    return result
+
+
+def find_contention(results):
+    """Stages whose median latency inflates with concurrency relative to one session"""
+    baseline = results[0]["stages"]
+    findings = []
+    for result in results[1:]:
+        for stage, p50 in result["stages"].items():
+            base = baseline.get(stage)
+            if base and p50 > base * CONTENTION_FACTOR and p50 - base > 1.0:
+                findings.append({"concurrency": result["concurrency"], "stage": stage,
+                                 "baseline_p50_ms": base, "p50_ms": p50,
+                                 "inflation": round(p50 / base, 2)})
+    return findings
+
+
+# Known shared resources behind the instrumented stages, to point readers at the cause
+SHARED_RESOURCES = {
+    "memory.save_memory": "MemoryManager pickles to one file per session id; main.py uses the fixed id "
+                          "'user_session', so every user rewrites the same file",
+    "answer_query.groq": "one module-level ChatGroq client (rag_pipeline.get_llm) shared by all sessions",
+    "refine_query.groq": "QueryRefiner client and its 4-thread _refinement_pool are shared by all sessions",
+    "retrieve.embed_query": "embedding runs on the shared embedding client and the GIL",
+    "retrieve.vector_search": "all sessions search the same FAISS index object",
+    "gemini.generate_response": "one module-level GeminiIntegration (rag_pipeline.get_gemini) shared by all sessions",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--turns", type=int, default=10, help="questions per session")
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="failure probability per backend call")
+    parser.add_argument("--shared-session", action="store_true",
+                        help="all sessions use one memory session id, as main.py does today")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    os.chdir(ROOT_DIR)
+    install_fakes(embed_latency=args.embed_latency, llm_latency=args.llm_latency,
+                  gemini_latency=args.gemini_latency, error_rate=args.error_rate)
+    import vector_database
+    from langchain_community.vectorstores import FAISS
+    from utils import memory_manager
+
+    memory_manager.MEMORY_DIR = tempfile.mkdtemp(prefix="load_memory_")
+    pages = []
+    for filename in sorted(os.listdir(vector_database.KNOWLEDGE_BASE_DIR)):
+        if filename.lower().endswith(".pdf"):
+            pages.extend(vector_database.load_pdf(os.path.join(vector_database.KNOWLEDGE_BASE_DIR, filename)))
+    db = FAISS.from_documents(vector_database.create_chunks(pages), vector_database.get_embedding_model())
+
+    levels = sorted(set(args.concurrency) | {1})
+    results = []
+    print(f"{'sessions':>8} {'turns/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for concurrency in levels:
+        result = run_level(concurrency, args.turns, db, args.shared_session)
+        results.append(result)
+        print(f"{concurrency:>8} {result['throughput_per_s']:>9.2f} {result.get('p50_ms', 0):>9.1f} "
+              f"{result.get('p95_ms', 0):>9.1f} {result.get('p99_ms', 0):>9.1f} {result['error_rate']:>7.1%}")
+
+    contention = find_contention(results)
+    if contention:
+        print("\nContention points (stage p50 vs. one session):")
+        for finding in contention:
+            print(f"  x{finding['concurrency']:<3} {finding['stage']:28s} {finding['baseline_p50_ms']:>8.1f} -> "
+                  f"{finding['p50_ms']:>8.1f} ms ({finding['inflation']}x)"
+                  f"  {SHARED_RESOURCES.get(finding['stage'], '')}")
+    else:
+        print("\nNo stage latency inflated with concurrency")
+
+    revision = git_revision()
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"revision": revision, "timestamp": datetime.now().isoformat(), "settings": vars(args),
+                   "levels": results, "contention": contention}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
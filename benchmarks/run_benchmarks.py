@@ -0,0 +1,287 @@
+"""
+Offline performance benchmarks for the legal assistant pipeline.
+
+    python -m benchmarks.run_benchmarks [--llm-latency 0.2] [--sizes 1000 10000]
+
+Ollama, Groq and Gemini are replaced by the deterministic stand-ins in
+benchmarks/fakes.py, so results only move when our own code does. Results are
+written as JSON to benchmarks/results/ for comparison across commits
+(see benchmarks/compare.py).
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.fakes import install_fakes, fake_summarizer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+QUERIES = [
+    "What does the declaration say about freedom of expression?",
+    "Is everyone entitled to a fair and public hearing?",
+    "Can anyone be subjected to torture or degrading punishment?",
+    "What rights does a person have regarding marriage and family?",
+    "Does everyone have the right to education?",
+    "Who is entitled to social security?",
+    "What protection exists against arbitrary arrest or detention?",
+    "Explain the right to own property.",
+]
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(pick(0.50) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "p99_ms": round(pick(0.99) * 1000, 3),
+    }
+
+
+class PeakMemory:
+    """Python heap peak (tracemalloc) for a block, plus the process RSS high-water mark"""
+
+    def __enter__(self):
+        tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.result = {
+            "python_peak_mb": round(peak / 2 ** 20, 2),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        }
+        return False
+
+
+def bench_ingestion(vector_database):
+    """Pages/sec and chunks/sec over the PDFs in knowledge_base/"""
+    from config import KNOWLEDGE_BASE_DIR
+
+    results, all_chunks = [], []
+    embeddings = vector_database.get_embedding_model()
+    for filename in sorted(os.listdir(KNOWLEDGE_BASE_DIR)):
+        if not filename.lower().endswith(".pdf"):
+            continue
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            pages = vector_database.load_pdf(os.path.join(KNOWLEDGE_BASE_DIR, filename))
+            loaded = time.perf_counter()
+            chunks = vector_database.create_chunks(pages)
+            chunked = time.perf_counter()
+            embeddings.embed_documents([chunk.page_content for chunk in chunks])
+            embedded = time.perf_counter()
+
+        total = embedded - start
+        results.append({
+            "file": filename,
+            "pages": len(pages),
+            "chunks": len(chunks),
+            "load_s": round(loaded - start, 4),
+            "chunk_s": round(chunked - loaded, 4),
+            "embed_s": round(embedded - chunked, 4),
+            "pages_per_s": round(len(pages) / total, 2) if total else None,
+            "chunks_per_s": round(len(chunks) / total, 2) if total else None,
+            **memory.result,
+        })
+        all_chunks.extend(chunks)
+    return results, all_chunks
+
+
+def synthetic_corpus(chunks, size):
+    """Replicate real chunks (with distinct suffixes) up to the requested index size"""
+    from langchain_core.documents import Document
+
+    corpus = []
+    while len(corpus) < size:
+        for chunk in chunks:
+            if len(corpus) >= size:
+                break
+            copy_no = len(corpus) // len(chunks)
+            corpus.append(Document(page_content=f"{chunk.page_content} [copy {copy_no}]",
+                                   metadata=dict(chunk.metadata, copy=copy_no)))
+    return corpus
+
+
+def bench_retrieval(vector_database, rag_pipeline, chunks, sizes, repeats):
+    """
+    Index build time and retrieve_docs latency at several index sizes: unfiltered,
+    filtered to one source, and with a flat scan instead of coarse-to-fine search
+    (with the share of the flat top-k that coarse-to-fine search also returns)
+    """
+    from langchain_community.vectorstores import FAISS
+    from utils import hierarchical_index
+
+    results = []
+    embeddings = vector_database.get_embedding_model()
+    for size in sizes:
+        corpus = synthetic_corpus(chunks, size)
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            db = FAISS.from_documents(corpus, embeddings)
+            db.hierarchy = hierarchical_index.HierarchicalIndex.from_faiss(db)  # built at ingestion
+            build_s = time.perf_counter() - start
+
+            samples, results_by_query = [], {}
+            for _ in range(repeats):
+                for query in QUERIES:
+                    start = time.perf_counter()
+                    results_by_query[query] = rag_pipeline.retrieve_docs(query, db)
+                    samples.append(time.perf_counter() - start)
+
+            flat, overlap = [], []
+            enabled, hierarchical_index.HIERARCHICAL_RETRIEVAL = hierarchical_index.HIERARCHICAL_RETRIEVAL, False
+            try:
+                for _ in range(repeats):
+                    for query in QUERIES:
+                        start = time.perf_counter()
+                        docs = rag_pipeline.retrieve_docs(query, db)
+                        flat.append(time.perf_counter() - start)
+                        expected = {doc.id for doc in docs}
+                        overlap.append(len(expected.intersection(doc.id for doc in results_by_query[query]))
+                                       / max(len(expected), 1))
+            finally:
+                hierarchical_index.HIERARCHICAL_RETRIEVAL = enabled
+
+            filters = {"source": corpus[0].metadata.get("source")}
+            filtered = []
+            for _ in range(repeats):
+                for query in QUERIES:
+                    start = time.perf_counter()
+                    rag_pipeline.retrieve_docs(query, db, filters=filters)
+                    filtered.append(time.perf_counter() - start)
+        results.append({"index_size": size, "build_s": round(build_s, 4),
+                        **percentiles(samples),
+                        **{f"filtered_{name}": value for name, value in percentiles(filtered).items()},
+                        **{f"flat_{name}": value for name, value in percentiles(flat).items()},
+                        "coarse_to_fine_overlap": round(sum(overlap) / len(overlap), 3),
+                        **memory.result})
+    return results
+
+
+def bench_query_embedding(vector_database, repeats):
+    """embed_query latency of the in-process hashing backend vs. the configured (stand-in) model"""
+    from utils.embeddings import HashingEmbeddings
+
+    results = {}
+    for name, embeddings in (("hashing", HashingEmbeddings()), ("configured", vector_database.get_embedding_model())):
+        samples = []
+        for _ in range(repeats):
+            for query in QUERIES:
+                start = time.perf_counter()
+                embeddings.embed_query(query)
+                samples.append(time.perf_counter() - start)
+        results[name] = percentiles(samples)
+    return results
+
+
+def bench_docstore(vector_database, chunks):
+    """Pickled docstore size (what index.pkl holds) with per-chunk copies vs. spans"""
+    from langchain_community.vectorstores import FAISS
+    from utils.span_docstore import SpanDocstore
+
+    db = FAISS.from_documents(chunks, vector_database.get_embedding_model())
+    copies_bytes = len(pickle.dumps(db.docstore))
+    spans_bytes = len(pickle.dumps(SpanDocstore.from_faiss(db)))
+    return {"chunks": len(chunks), "in_memory_docstore_bytes": copies_bytes,
+            "span_docstore_bytes": spans_bytes, "ratio": round(spans_bytes / copies_bytes, 3)}
+
+
+def bench_end_to_end(vector_database, rag_pipeline, chunks, repeats):
+    """answer_query_with_fallback latency including memory handling"""
+    from langchain_community.vectorstores import FAISS
+    from utils import memory_manager
+
+    memory_manager.MEMORY_DIR = tempfile.mkdtemp(prefix="bench_memory_")
+    manager = memory_manager.MemoryManager(session_id="benchmark", summarizer=fake_summarizer)
+    db = FAISS.from_documents(chunks, vector_database.get_embedding_model())
+
+    samples = []
+    with PeakMemory() as memory:
+        for _ in range(repeats):
+            for query in QUERIES:
+                start = time.perf_counter()
+                docs = rag_pipeline.retrieve_docs(query, db)
+                rag_pipeline.answer_query_with_fallback(docs, query, manager)
+                samples.append(time.perf_counter() - start)
+    return {"turns": len(samples), **percentiles(samples), **memory.result}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000],
+                        help="index sizes (chunks) for the retrieval benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="passes over the query set")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds injected per embedded text")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds injected per chat-model call")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="seconds injected per Gemini call")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<rev>.json)")
+    args = parser.parse_args()
+
+    # config.py paths are relative to the project root
+    os.chdir(ROOT_DIR)
+    install_fakes(embed_latency=args.embed_latency, llm_latency=args.llm_latency,
+                  gemini_latency=args.gemini_latency)
+    import vector_database
+    import rag_pipeline
+
+    ingestion, chunks = bench_ingestion(vector_database)
+    if not chunks:
+        raise SystemExit("No chunks extracted from knowledge_base/; nothing to benchmark")
+    print(f"Ingestion: {json.dumps(ingestion, indent=2)}")
+
+    docstore = bench_docstore(vector_database, chunks)
+    print(f"Docstore: {json.dumps(docstore, indent=2)}")
+
+    query_embedding = bench_query_embedding(vector_database, args.repeats)
+    print(f"Query embedding: {json.dumps(query_embedding, indent=2)}")
+
+    retrieval = bench_retrieval(vector_database, rag_pipeline, chunks, args.sizes, args.repeats)
+    print(f"Retrieval: {json.dumps(retrieval, indent=2)}")
+
+    end_to_end = bench_end_to_end(vector_database, rag_pipeline, chunks, args.repeats)
+    print(f"End to end: {json.dumps(end_to_end, indent=2)}")
+
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "ingestion": ingestion,
+        "docstore": docstore,
+        "query_embedding": query_embedding,
+        "retrieval": retrieval,
+        "end_to_end": end_to_end,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
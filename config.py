@@ -8,9 +8,119 @@ TRAINED_MODELS_DIR = 'trained_models/'
 PRETRAINED_DB_PATH = "vectorstore/pretrained_db"
 FAISS_DB_PATH = "vectorstore/db_faiss"
 OLLAMA_MODEL_NAME = "deepseek-r1:1.5b"
+# Embedding backend: "ollama" (OLLAMA_MODEL_NAME over HTTP) or "hashing" (in-process
+# hashed word/bigram vectors of HASHING_EMBEDDING_DIM, no server needed). Indexes
+# record the model they were built with and are not loaded under a different one.
+EMBEDDING_BACKEND = "ollama"
+HASHING_EMBEDDING_DIM = 768
+# Ollama model residency: the embedding model is loaded at app start and pinged every
+# OLLAMA_KEEPALIVE_INTERVAL seconds (asking Ollama to keep it for OLLAMA_KEEP_ALIVE)
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_KEEPALIVE_INTERVAL = 120
+OLLAMA_WARMUP_TIMEOUT = 120
+# Query embeddings go first: bulk (ingestion) embedding is sent in slices of
+# OLLAMA_BULK_SLICE texts that wait while a query ran in the last QUERY_PRIORITY_WINDOW
+# seconds, for at most QUERY_PRIORITY_MAX_WAIT seconds per slice
+OLLAMA_BULK_SLICE = 8
+QUERY_PRIORITY_WINDOW = 1.0
+QUERY_PRIORITY_MAX_WAIT = 10.0
 
-# Ensure directories exist
-os.makedirs(KNOWLEDGE_BASE_DIR, exist_ok=True)
-os.makedirs(USER_UPLOADS_DIR, exist_ok=True)
-os.makedirs(TRAINED_MODELS_DIR, exist_ok=True)
-os.makedirs(os.path.dirname(PRETRAINED_DB_PATH), exist_ok=True)
\ No newline at end of file
+
+def ensure_directories():
+    """Create the data directories; called at app start and before ingestion, not on import"""
+    os.makedirs(KNOWLEDGE_BASE_DIR, exist_ok=True)
+    os.makedirs(USER_UPLOADS_DIR, exist_ok=True)
+    os.makedirs(TRAINED_MODELS_DIR, exist_ok=True)
+    os.makedirs(os.path.dirname(PRETRAINED_DB_PATH), exist_ok=True)
+
+
+# Conversation memory
+# "window" keeps the last MEMORY_WINDOW_SIZE turns verbatim; "summary" also folds
+# turns that fall out of the window into a running summary kept under budget.
+MEMORY_MODE = "summary"
+MEMORY_WINDOW_SIZE = 5
+MEMORY_TOKEN_BUDGET = 1200
+SUMMARY_MODEL_NAME = "llama-3.1-8b-instant"
+
+# Show DeepSeek-R1 reasoning traces in a collapsible panel under each answer
+SHOW_REASONING = True
+# Chat messages drawn on each rerun; older ones appear this many at a time on request
+CHAT_RENDER_WINDOW = 20
+
+# Retrieval
+RETRIEVAL_K = 4
+# Rewrite follow-up questions with chat history; retrieval on the raw query runs meanwhile
+ENABLE_QUERY_REFINEMENT = True
+QUERY_REFINER_MODEL_NAME = "mixtral-8x7b-32768"
+QUERY_REFINER_CACHE_SIZE = 256
+
+# Uploaded documents are indexed in the background, this many pages per batch
+UPLOAD_INDEX_BATCH_PAGES = 8
+# Seconds a question waits for the first indexed batch of a fresh upload
+UPLOAD_FIRST_BATCH_TIMEOUT = 60
+
+# Knowledge-base rebuilds go into a new versioned directory; a pointer file names
+# the version serving queries and the last KB_KEEP_VERSIONS are kept for rollback
+KB_VERSIONS_DIR = "vectorstore/pretrained_versions"
+KB_CURRENT_POINTER = "vectorstore/pretrained_current.json"
+KB_KEEP_VERSIONS = 3
+
+# Extra knowledge-base shards (e.g. per act or jurisdiction) are built and dropped
+# independently and searched together with the knowledge base and any upload
+SHARDS_DIR = "vectorstore/shards"
+FEDERATED_SEARCH_WORKERS = 4
+FEDERATE_UPLOADS_WITH_KB = True
+
+# Background jobs (knowledge-base builds, upload indexing) run in worker processes
+JOB_QUEUE_DB = "vectorstore/jobs.sqlite3"
+# Usage and feedback counters (totals and hourly buckets) kept across sessions
+ANALYTICS_DB = "vectorstore/analytics.sqlite3"
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 0.5
+JOB_MAX_ATTEMPTS = 2
+UPLOAD_INDEX_DIR = "vectorstore/uploads"
+# Seconds between snapshots of a growing upload index that the UI picks up
+UPLOAD_SNAPSHOT_INTERVAL = 5
+
+# Chunking and embedding
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# "legal" emits one chunk per Article/Section/Clause/Schedule, split at sub-clauses
+# only when longer than CHUNK_SIZE; "recursive" is the generic character splitter
+CHUNKING_STRATEGY = "legal"
+EMBED_BATCH_SIZE = 64
+# Near-duplicate chunks (MinHash estimated Jaccard >= threshold) are embedded once;
+# the kept chunk lists the other copies in its duplicate_sources metadata
+DEDUP_ENABLED = True
+DEDUP_THRESHOLD = 0.85
+# Store chunk text as spans into one copy of the source text instead of a copy per chunk
+COMPACT_DOCSTORE = True
+# Compact vector storage for knowledge-base indexes and shards: "none", "fp16" (2x smaller),
+# "int8" (4x), "pca" (projection to PCA_DIMENSIONS) or "pca+int8"/"pca+fp16". Full-precision
+# vectors stay on disk, memory-mapped, and re-score RESCORE_OVERSAMPLE x k candidates exactly.
+VECTOR_COMPRESSION = "none"
+PCA_DIMENSIONS = 256
+RESCORE_OVERSAMPLE = 4
+# Coarse-to-fine retrieval for large indexes: from HIERARCHICAL_MIN_CHUNKS chunks on, a
+# query first picks the HIERARCHY_DOC_FANOUT nearest documents by their mean vector, then
+# the HIERARCHY_SECTION_FANOUT nearest sections in them, and only their chunks are scanned
+HIERARCHICAL_RETRIEVAL = True
+HIERARCHICAL_MIN_CHUNKS = 2000
+HIERARCHY_DOC_FANOUT = 8
+HIERARCHY_SECTION_FANOUT = 32
+# Optional {file name: {"jurisdiction", "doc_type", "date"}} used as search filter fields
+KB_METADATA_FILE = "knowledge_base/metadata.json"
+# Knowledge-base builds checkpoint embedded batches here and resume after a crash
+KB_CHECKPOINT_DIR = "vectorstore/checkpoints"
+
+# Per-stage latency metrics (Analytics tab and a Prometheus text file)
+METRICS_ENABLED = True
+METRICS_DIR = "vectorstore/metrics"
+METRICS_EXPORT_INTERVAL = 15
+
+# Per-process memory budget for ingestion in MB (0 disables the check). Over budget,
+# OCR and upload indexing fall back to one page at a time, then reject the document.
+MEMORY_BUDGET_MB = 2048
+# Also record tracemalloc peaks and top allocation sites per ingestion stage (slow)
+MEMORY_PROFILING = False
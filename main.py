@@ -1,18 +1,39 @@
 import streamlit as st
 from rag_pipeline import (
     process_user_query,
-    retrieve_docs,
+    get_upload_index,
+    retrieve_docs_with_refinement,
+    get_filter_values,
     answer_query_with_fallback
 )
 from utils.memory_manager import get_memory_manager
-from vector_database import train_on_articles, load_vector_store
-from config import PRETRAINED_DB_PATH, KNOWLEDGE_BASE_DIR
+from vector_database import (
+    get_active_kb_path,
+    get_active_kb_version,
+    get_serving_store,
+    get_federated_store,
+    start_kb_rebuild,
+    get_kb_rebuild_status,
+    list_kb_versions,
+    activate_kb_version,
+    list_shards,
+    start_shard_build,
+    drop_shard,
+    get_model_residency
+)
+from utils.analytics_store import RATINGS, get_analytics_store
+from utils.job_queue import ensure_worker_pool, get_job_queue
+from utils.metrics import collect_snapshot, latency_summary, ratio, start_file_exporter
+from config import (CHAT_RENDER_WINDOW, KNOWLEDGE_BASE_DIR, OLLAMA_WARMUP_TIMEOUT, SHOW_REASONING, VECTOR_COMPRESSION,
+                    ensure_directories)
 import os
 import json
+from collections import Counter
 from datetime import datetime
-import pandas as pd
-import plotly.express as px
-from streamlit_option_menu import option_menu
+
+# Analytics tab windows: hours of hourly buckets to sum (None = all time)
+ANALYTICS_WINDOWS = {"This session": "session", "Last 24 hours": 24, "Last 7 days": 24 * 7, "All time": None}
+RATING_LABELS = {'good': '👍 Good', 'bad': '👎 Needs Improvement', 'neutral': '📝 With Notes'}
 
 
 # Custom CSS for beautiful dark theme styling
@@ -236,20 +257,48 @@ def inject_custom_css():
 
 
 def initialize_pretrained_db():
-    if not os.path.exists(PRETRAINED_DB_PATH):
-        st.info("Initializing legal knowledge base...")
-        train_on_articles()
-    return load_vector_store()
+    if not os.path.exists(get_active_kb_path()):
+        # Built by a worker process; the page stays usable meanwhile
+        start_kb_rebuild()
+        st.info("Initializing legal knowledge base in the background...")
+        return None
+    store = get_serving_store()
+    if store is None:
+        st.warning("⚠️ The knowledge base could not be loaded (built with another embedding model?) "
+                   "- rebuild it from the sidebar")
+    return store
 
 
 def load_chat_history():
     """Load chat history from session state"""
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
+    if 'chat_stats' not in st.session_state:
+        reset_chat_stats()
     return st.session_state.chat_history
 
 
-def save_chat_message(role, message, feedback=None):
+def reset_chat_stats():
+    """Running counters of this session's messages and feedback, kept in step with chat_history"""
+    st.session_state.chat_stats = Counter()
+    st.session_state.recent_comments = []
+
+
+def clear_chat_history():
+    st.session_state.chat_history = []
+    st.session_state.chat_window = CHAT_RENDER_WINDOW
+    reset_chat_stats()
+
+
+def _record_analytics(update, *args, **kwargs):
+    # Analytics must never break the chat
+    try:
+        update(*args, **kwargs)
+    except Exception as e:
+        print(f"Could not record analytics: {str(e)}")
+
+
+def save_chat_message(role, message, feedback=None, reasoning=None):
     """Save chat message to history"""
     chat_entry = {
         'timestamp': datetime.now().isoformat(),
@@ -257,13 +306,36 @@ def save_chat_message(role, message, feedback=None):
         'message': message,
         'feedback': feedback
     }
+    if reasoning:
+        chat_entry['reasoning'] = reasoning
     st.session_state.chat_history.append(chat_entry)
+    st.session_state.chat_stats.update({'messages': 1, f'messages.{role}': 1})
+    _record_analytics(get_analytics_store().record_message, role)
 
 
 def save_feedback(feedback, message_index):
     """Save user feedback for a specific message"""
     if 0 <= message_index < len(st.session_state.chat_history):
-        st.session_state.chat_history[message_index]['feedback'] = feedback
+        message = st.session_state.chat_history[message_index]
+        previous = message.get('feedback')
+        previous = previous if isinstance(previous, dict) else {}
+        previous_rating, previous_rated_at = previous.get('rating'), previous.get('rated_at')
+        # Kept with the feedback so a later re-rating is taken out of the same hourly bucket
+        rated_at = datetime.now()
+        feedback = {**feedback, 'rated_at': rated_at.isoformat()}
+        message['feedback'] = feedback
+
+        rating, comment = feedback.get('rating', 'neutral'), feedback.get('comment', '')
+        stats = st.session_state.chat_stats
+        stats[f'rating.{rating}'] += 1
+        if previous_rating:
+            stats[f'rating.{previous_rating}'] -= 1
+        else:
+            stats['feedback'] += 1
+        if comment:
+            st.session_state.recent_comments = (st.session_state.recent_comments + [comment])[-3:]
+        _record_analytics(get_analytics_store().record_feedback, rating, comment, previous_rating, rated_at,
+                          datetime.fromisoformat(previous_rated_at) if previous_rated_at else None)
         st.success("✅ Feedback saved!")
 
 
@@ -274,44 +346,33 @@ def export_chat_history():
     return None
 
 
-def analyze_feedback():
-    """Analyze feedback statistics with detailed metrics"""
-    if not st.session_state.chat_history:
-        return None
-
-    feedbacks = [msg.get('feedback') for msg in st.session_state.chat_history
-                 if msg.get('feedback') and msg['role'] == 'assistant']
-
-    if not feedbacks:
+def analyze_feedback(window="session"):
+    """
+    Feedback statistics from running counters: this session's, or the persistent
+    ones summed over the last window hours (None = all time)
+    """
+    if window == "session":
+        totals, comments = st.session_state.chat_stats, st.session_state.recent_comments
+    else:
+        try:
+            store = get_analytics_store()
+            totals, comments = store.totals(window), store.recent_comments(3, window)
+        except Exception as e:
+            print(f"Could not read analytics: {str(e)}")
+            return None
+
+    if not totals.get('feedback'):
         return None
-
-    # Count ratings and collect data
-    rating_counts = {'👍 Good': 0, '👎 Needs Improvement': 0, '📝 With Notes': 0}
-    comments = []
-
-    for feedback in feedbacks:
-        if isinstance(feedback, dict):
-            rating = feedback.get('rating', 'neutral')
-            if rating == 'good':
-                rating_counts['👍 Good'] += 1
-            elif rating == 'bad':
-                rating_counts['👎 Needs Improvement'] += 1
-            elif rating == 'neutral':
-                rating_counts['📝 With Notes'] += 1
-
-            comment = feedback.get('comment', '')
-            if comment:
-                comments.append(comment)
-
+    ai_messages = totals.get('messages.assistant', 0)
     return {
-        'total_feedback': len(feedbacks),
-        'rating_distribution': rating_counts,
-        'total_messages': len(st.session_state.chat_history),
-        'user_messages': len([m for m in st.session_state.chat_history if m['role'] == 'user']),
-        'ai_messages': len([m for m in st.session_state.chat_history if m['role'] == 'assistant']),
-        'recent_comments': comments[-3:] if comments else [],
-        'feedback_ratio': len(feedbacks) / len([m for m in st.session_state.chat_history if
-                                                m['role'] == 'assistant']) * 100 if st.session_state.chat_history else 0
+        'total_feedback': totals['feedback'],
+        'rating_distribution': {RATING_LABELS[rating]: max(totals.get(f'rating.{rating}', 0), 0)
+                                for rating in RATINGS},
+        'total_messages': totals.get('messages', 0),
+        'user_messages': totals.get('messages.user', 0),
+        'ai_messages': ai_messages,
+        'recent_comments': comments,
+        'feedback_ratio': totals['feedback'] / ai_messages * 100 if ai_messages else 0
     }
 
 
@@ -320,6 +381,10 @@ def create_feedback_chart(feedback_data):
     if not feedback_data:
         return None
 
+    # Charting libraries are only needed on the Analytics tab
+    import pandas as pd
+    import plotly.express as px
+
     # Create pie chart for ratings
     ratings_df = pd.DataFrame({
         'Rating': list(feedback_data['rating_distribution'].keys()),
@@ -349,7 +414,8 @@ def show_analytics():
     </div>
     """, unsafe_allow_html=True)
 
-    feedback_data = analyze_feedback()
+    window = st.radio("Period", list(ANALYTICS_WINDOWS), horizontal=True, label_visibility="collapsed")
+    feedback_data = analyze_feedback(ANALYTICS_WINDOWS[window])
 
     if feedback_data:
         # Metrics in columns
@@ -378,6 +444,30 @@ def show_analytics():
     else:
         st.info("🌟 No feedback data yet. Start chatting and provide feedback to see analytics!")
 
+    show_latency_panel()
+
+
+def show_latency_panel():
+    """Per-stage latency percentiles and pipeline rates from utils.metrics"""
+    import pandas as pd
+
+    st.markdown("### ⏱️ Pipeline Latency")
+    snapshot = collect_snapshot()
+    rows = latency_summary(snapshot)
+    if not rows:
+        st.info("⏱️ No timings recorded yet.")
+        return
+
+    cache_hit_rate = ratio(snapshot, "refiner.cache_hit", ["refiner.cache_hit", "refiner.cache_miss"])
+    fallback_rate = ratio(snapshot, "pipeline.gemini_fallback", ["pipeline.answers"])
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("🗂️ Refiner Cache Hit Rate", f"{cache_hit_rate * 100:.1f}%" if cache_hit_rate is not None else "–")
+    with col2:
+        st.metric("🔁 Gemini Fallback Rate", f"{fallback_rate * 100:.1f}%" if fallback_rate is not None else "–")
+
+    st.dataframe(pd.DataFrame(rows).set_index("stage"), use_container_width=True)
+
 
 def show_settings():
     """Show settings content"""
@@ -391,13 +481,11 @@ def show_settings():
     # Model management
     st.markdown("### 🧠 Knowledge Base Management")
     if st.button("🔄 Update Knowledge Base", help="Refresh the AI's legal knowledge with latest articles"):
-        with st.spinner("🔄 Updating knowledge base..."):
-            try:
-                train_on_articles()
-                st.session_state.pretrained_db = load_vector_store()
-                st.success("✅ Knowledge base updated successfully!")
-            except Exception as e:
-                st.error(f"❌ Error: {str(e)}")
+        if start_kb_rebuild():
+            st.success("✅ Rebuild started - questions keep using the current knowledge base until it finishes")
+        else:
+            st.info("⏳ A rebuild is already running")
+    show_kb_versions()
 
     # Chat history management
     st.markdown("### 💾 Chat History")
@@ -417,37 +505,138 @@ def show_settings():
 
         # Clear history button
         if st.button("🗑️ Clear All Chat History", help="Start a fresh conversation"):
-            st.session_state.chat_history = []
+            clear_chat_history()
             st.success("✅ Chat history cleared!")
             st.rerun()
     else:
         st.info("💭 No chat history yet. Start a conversation to see options here.")
 
 
-def show_chat():
-    """Show chat content"""
-    # Display chat messages with beautiful styling
-    for i, chat in enumerate(st.session_state.chat_history):
-        if chat['role'] == 'user':
-            with st.chat_message("user", avatar="💬"):
-                st.markdown(f"**You:**\n{chat['message']}")
+@st.fragment(run_every=5)
+def show_kb_versions():
+    """Rebuild status and the kept knowledge-base versions with rollback"""
+    residency = get_model_residency()
+    if residency:
+        status = residency.status()
+        if status['state'] == 'ready':
+            st.caption(f"🟢 Embedding model {status['model']} loaded"
+                       + (f" (warm-up {status['warmup_seconds']}s)" if status['warmup_seconds'] else ""))
+        elif status['state'] == 'unavailable':
+            st.warning(f"⚠️ Ollama unreachable: {status['error']}")
         else:
-            with st.chat_message("assistant", avatar="⚖️"):
-                st.markdown(f"**Assistant:**\n{chat['message']}")
-
-                # Feedback buttons
-                col1, col2, col3 = st.columns([1, 1, 2])
-                with col1:
-                    if st.button("👍", key=f"good_{i}", help="Good response", use_container_width=True):
-                        save_feedback({"rating": "good", "comment": "User liked the response"}, i)
-                with col2:
-                    if st.button("👎", key=f"bad_{i}", help="Needs improvement", use_container_width=True):
-                        save_feedback({"rating": "bad", "comment": "User disliked the response"}, i)
-                with col3:
-                    if st.button("💬 Add Note", key=f"note_{i}", help="Add specific feedback", use_container_width=True):
-                        note = st.text_input("Your note:", key=f"note_input_{i}", label_visibility="collapsed")
-                        if note:
-                            save_feedback({"rating": "neutral", "comment": note}, i)
+            st.caption(f"⏳ Loading embedding model {status['model']}...")
+    job = get_kb_rebuild_status()
+    if job and job['status'] == 'queued':
+        st.info("⏳ Knowledge base rebuild is queued...")
+    elif job and job['status'] == 'running':
+        st.progress(job['progress'], text=f"⏳ Rebuilding knowledge base (started {job['started_at'][:19]})...")
+    elif job and job['status'] == 'failed':
+        st.error(f"❌ Last rebuild failed: {job['error']}")
+    elif job and job['status'] == 'done':
+        st.success(f"✅ Now serving knowledge base {job['result'].get('version')}")
+
+    active = get_active_kb_version()
+    for info in list_kb_versions():
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            label = "🟢 " if info['version'] == active else ""
+            st.markdown(f"{label}**{info['version']}** - {info['chunks']} chunks from {len(info['files'])} files")
+        with col2:
+            if info['version'] != active and st.button("↩️ Activate", key=f"kb_{info['version']}"):
+                activate_kb_version(info['version'])
+                st.rerun(scope="fragment")
+
+    with st.expander("🧩 Shards"):
+        for shard in list_shards():
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.markdown(f"**{shard['name']}** - {shard['chunks']} chunks from {len(shard['files'])} files"
+                            f" ({shard.get('compression', 'none')} vectors)")
+            with col2:
+                if st.button("🗑️ Drop", key=f"shard_{shard['name']}"):
+                    drop_shard(shard['name'])
+                    st.rerun(scope="fragment")
+        with st.form("new_shard", clear_on_submit=True):
+            name = st.text_input("Shard name", placeholder="e.g. india_acts")
+            pdfs = sorted(f for f in os.listdir(KNOWLEDGE_BASE_DIR) if f.lower().endswith('.pdf')) \
+                if os.path.isdir(KNOWLEDGE_BASE_DIR) else []
+            files = st.multiselect("Documents", pdfs)
+            modes = ["none", "fp16", "int8", "pca", "pca+int8"]
+            compression = st.selectbox("Vector storage", modes,
+                                       index=modes.index(VECTOR_COMPRESSION) if VECTOR_COMPRESSION in modes else 0)
+            if st.form_submit_button("🔨 Build shard"):
+                try:
+                    start_shard_build(name.strip(), files, compression)
+                    st.success(f"✅ Shard {name.strip()} queued")
+                except ValueError as e:
+                    st.error(f"❌ {str(e)}")
+
+    with st.expander("🛠️ Background jobs"):
+        for job in get_job_queue().list_jobs(limit=10):
+            st.markdown(f"`#{job['id']}` **{job['kind']}** - {job['status']} "
+                        f"({job['progress'] * 100:.0f}%) {job['error'] or ''}")
+
+
+def _show_older_messages():
+    st.session_state.chat_window += CHAT_RENDER_WINDOW
+
+
+def show_chat():
+    """Show the latest CHAT_RENDER_WINDOW messages; older ones are loaded on request"""
+    history = st.session_state.chat_history
+    window = st.session_state.setdefault('chat_window', CHAT_RENDER_WINDOW)
+    start = max(0, len(history) - window)
+    if start:
+        st.button(f"⬆️ Show {min(start, CHAT_RENDER_WINDOW)} older messages ({start} hidden)",
+                  key="load_older_messages", on_click=_show_older_messages, use_container_width=True)
+    for i in range(start, len(history)):
+        render_message(i)
+
+
+@st.fragment
+def render_message(i):
+    """One chat message with its feedback buttons; a feedback click reruns only this message"""
+    chat = st.session_state.chat_history[i]
+    if chat['role'] == 'user':
+        with st.chat_message("user", avatar="💬"):
+            st.markdown(f"**You:**\n{chat['message']}")
+    else:
+        with st.chat_message("assistant", avatar="⚖️"):
+            st.markdown(f"**Assistant:**\n{chat['message']}")
+            if chat.get('reasoning'):
+                with st.expander("🧠 Show reasoning"):
+                    st.markdown(chat['reasoning'])
+
+            # Feedback buttons
+            col1, col2, col3 = st.columns([1, 1, 2])
+            with col1:
+                if st.button("👍", key=f"good_{i}", help="Good response", use_container_width=True):
+                    save_feedback({"rating": "good", "comment": "User liked the response"}, i)
+            with col2:
+                if st.button("👎", key=f"bad_{i}", help="Needs improvement", use_container_width=True):
+                    save_feedback({"rating": "bad", "comment": "User disliked the response"}, i)
+            with col3:
+                if st.button("💬 Add Note", key=f"note_{i}", help="Add specific feedback", use_container_width=True):
+                    note = st.text_input("Your note:", key=f"note_input_{i}", label_visibility="collapsed")
+                    if note:
+                        save_feedback({"rating": "neutral", "comment": note}, i)
+
+
+@st.fragment(run_every=2)
+def show_indexing_progress():
+    """Live progress of the background indexing of the uploaded document"""
+    user_db = st.session_state.get('user_db')
+    if user_db is None:
+        return
+    user_db.refresh()
+    if user_db.status == "error":
+        st.error(f"❌ Could not index document: {user_db.error}")
+    elif user_db.status == "ready":
+        st.caption(f"📚 Document fully indexed ({user_db.total_pages} pages)")
+    else:
+        st.progress(user_db.progress,
+                    text=f"📑 Indexed {user_db.pages_indexed} of {user_db.total_pages or '?'} pages "
+                         f"- you can already ask questions")
 
 
 def show_right_panel_content(selected_tab):
@@ -481,11 +670,11 @@ def show_right_panel_content(selected_tab):
         """, unsafe_allow_html=True)
 
         if st.session_state.chat_history:
-            st.info(f"💬 {len([m for m in st.session_state.chat_history if m['role'] == 'user'])} questions asked")
-            st.info(f"⚖️ {len([m for m in st.session_state.chat_history if m['role'] == 'assistant'])} responses given")
+            st.info(f"💬 {st.session_state.chat_stats['messages.user']} questions asked")
+            st.info(f"⚖️ {st.session_state.chat_stats['messages.assistant']} responses given")
 
             if st.button("🗑️ Clear Chat", use_container_width=True):
-                st.session_state.chat_history = []
+                clear_chat_history()
                 st.rerun()
         else:
             st.info("💭 Start chatting to see quick actions here")
@@ -500,33 +689,42 @@ def show_left_panel_content(selected_tab):
         user_query = st.chat_input("💭 Ask your legal question here...")
 
         if user_query:
+            # New messages are drawn in place below the transcript instead of rerunning the page
             save_chat_message('user', user_query)
+            render_message(len(st.session_state.chat_history) - 1)
+            residency = get_model_residency()
+            if residency and residency.state in ("cold", "loading"):
+                with st.spinner("⏳ Loading the embedding model..."):
+                    residency.wait_until_ready(OLLAMA_WARMUP_TIMEOUT)
             with st.spinner("🔍 Analyzing your question..."):
                 try:
                     if 'uploaded_file' in st.session_state:
-                        response = process_user_query(
+                        response, reasoning = process_user_query(
                             st.session_state.uploaded_file,
                             user_query,
-                            st.session_state.memory_manager  # Changed here
+                            st.session_state.memory_manager,  # Changed here
+                            with_reasoning=True
                         )
                     else:
-                        retrieved_docs = retrieve_docs(
+                        retrieved_docs = retrieve_docs_with_refinement(
                             user_query,
-                            st.session_state.pretrained_db
+                            get_federated_store(),
+                            st.session_state.memory_manager,
+                            filters=st.session_state.get('search_filters')
                         )
-                        response = answer_query_with_fallback(
+                        response, reasoning = answer_query_with_fallback(
                             retrieved_docs,
                             user_query,
-                            st.session_state.memory_manager  # Changed here
+                            st.session_state.memory_manager,  # Changed here
+                            with_reasoning=True
                         )
 
-                    save_chat_message('assistant', response)
-                    st.rerun()
-
+                    save_chat_message('assistant', response,
+                                      reasoning=reasoning if SHOW_REASONING else None)
                 except Exception as e:
                     error_msg = f"❌ Sorry, I encountered an error: {str(e)}"
                     save_chat_message('assistant', error_msg)
-                    st.rerun()
+            render_message(len(st.session_state.chat_history) - 1)
 
     elif selected_tab == "📈 Analytics":
         show_analytics()
@@ -546,6 +744,16 @@ def main():
     # Inject custom CSS
     inject_custom_css()
 
+    from streamlit_option_menu import option_menu
+
+    # Data directories, background workers for indexing and knowledge-base builds
+    ensure_directories()
+    ensure_worker_pool()
+    start_file_exporter()
+    residency = get_model_residency()
+    if residency:
+        residency.start()
+
     # Initialize session state
     if 'pretrained_db' not in st.session_state:
         st.session_state.pretrained_db = initialize_pretrained_db()
@@ -608,15 +816,20 @@ def main():
                 help="Upload your legal document for detailed analysis"
             )
             if uploaded_file:
-                os.makedirs("user_uploads", exist_ok=True)
-                save_path = os.path.join("user_uploads", uploaded_file.name)
-                with open(save_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+                # Indexing starts right away in the background
+                get_upload_index(uploaded_file)
                 st.session_state.uploaded_file = uploaded_file
                 st.success("✅ Document uploaded successfully!")
+                show_indexing_progress()
         else:
             if 'uploaded_file' in st.session_state:
                 del st.session_state.uploaded_file
+            selected_sources = st.multiselect(
+                "📚 Search only in",
+                get_filter_values("source"),
+                help="Leave empty to search the whole knowledge base"
+            )
+            st.session_state.search_filters = {"source": {"$in": selected_sources}} if selected_sources else None
 
         st.markdown("---")
         st.markdown("""
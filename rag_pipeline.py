@@ -1,17 +1,44 @@
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from utils.memory_manager import MemoryManager
-from vector_database import load_vector_store, process_user_pdf
+from vector_database import get_federated_store, save_upload, ProgressiveIndex
+from utils.federated_search import FederatedStore
+from utils.query_refiner import QueryRefiner
+from utils.metrics import span, incr
+from config import RETRIEVAL_K, ENABLE_QUERY_REFINEMENT, UPLOAD_FIRST_BATCH_TIMEOUT, FEDERATE_UPLOADS_WITH_KB
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import uuid
 import streamlit as st
 from dotenv import load_dotenv
-from utils.gemini_integration import GeminiIntegration
+from utils.response_parser import split_reasoning
 
 load_dotenv()
 
-# Initialize LLM
-llm_model = ChatGroq(model="deepseek-r1-distill-llama-70b")
-gemini = GeminiIntegration()  # Initialize Gemini here
+# LLM clients are built on first use so importing this module stays cheap
+_llm_model = None
+_gemini = None
+_client_lock = threading.Lock()
+query_refiner = QueryRefiner()
+_refinement_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-refiner")
+
+
+def get_llm():
+    global _llm_model
+    if _llm_model is None:
+        with _client_lock:
+            if _llm_model is None:
+                from langchain_groq import ChatGroq
+                _llm_model = ChatGroq(model="deepseek-r1-distill-llama-70b")
+    return _llm_model
+
+
+def get_gemini():
+    global _gemini
+    if _gemini is None:
+        with _client_lock:
+            if _gemini is None:
+                from utils.gemini_integration import GeminiIntegration
+                _gemini = GeminiIntegration()
+    return _gemini
 
 
 def get_memory_manager():
@@ -24,45 +51,148 @@ def get_context(documents):
     return "\n\n".join([doc.page_content for doc in documents])
 
 
-def retrieve_docs(query, custom_db=None):
-    db_to_use = custom_db if custom_db else load_vector_store()
+def retrieve_docs(query, custom_db=None, k=RETRIEVAL_K, filters=None):
+    """
+    Top-k chunks for the query. filters restricts the search to chunks whose metadata
+    matches, e.g. {"source": "udhr.pdf"} or {"jurisdiction": {"$in": ["IN", "UK"]}, "page": {"$lte": 20}}
+    """
+    db_to_use = custom_db if custom_db else get_federated_store()
     if not db_to_use:
-        raise ValueError("No vector database available")
-    return db_to_use.similarity_search(query)
+        raise ValueError("No vector database available yet - the knowledge base may still be building")
+
+    from utils.metadata_index import search_with_filter
+
+    with span("retrieve_docs"):
+        if hasattr(db_to_use, "similarity_search_by_vector"):
+            with span("retrieve.embed_query"):
+                vector = db_to_use.embedding_function.embed_query(query)
+            with span("retrieve.vector_search"):
+                if isinstance(db_to_use, FederatedStore):
+                    return db_to_use.similarity_search_by_vector(vector, k=k, filters=filters)
+                return search_with_filter(db_to_use, vector, k, filters)
+        # Stores without a FAISS index of their own (a growing upload) post-filter instead
+        return db_to_use.similarity_search(query, k=k, **({"filter": filters} if filters else {}))
+
+
+def get_filter_values(field):
+    """Values of a metadata filter field across the knowledge base and its shards, for the sidebar"""
+    from utils.metadata_index import get_metadata_index
+    values = set()
+    for _, db in get_federated_store().shards:
+        values.update(get_metadata_index(db).values(field))
+    return sorted(values, key=str)
+
+
+def _doc_key(doc):
+    metadata = doc.metadata or {}
+    return metadata.get("source"), metadata.get("page"), metadata.get("start_index"), doc.page_content
+
+
+def merge_results(*result_lists, k=RETRIEVAL_K):
+    """Interleave ranked result lists, dropping duplicates, keeping at most k documents"""
+    merged, seen = [], set()
+    for rank in range(max((len(results) for results in result_lists), default=0)):
+        for results in result_lists:
+            if rank < len(results):
+                key = _doc_key(results[rank])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(results[rank])
+    return merged[:k]
+
+
+def retrieve_docs_with_refinement(query, custom_db=None, memory_manager=None, k=RETRIEVAL_K, filters=None):
+    """
+    Retrieve on the raw query while the history-aware rewrite is computed, then
+    retrieve on the rewrite and merge both result sets
+    """
+    history = []
+    if memory_manager:
+        history = memory_manager.get_memory().get("chat_history", "").splitlines()
+
+    if not ENABLE_QUERY_REFINEMENT or not query_refiner.needs_refinement(query, history):
+        return retrieve_docs(query, custom_db, k, filters)
+
+    db_to_use = custom_db if custom_db else get_federated_store()
+    cached = query_refiner.get_cached(query, history)
+    refinement = None if cached is not None else _refinement_pool.submit(
+        query_refiner.rewrite, query, history)
 
+    raw_docs = retrieve_docs(query, db_to_use, k, filters)
 
-def answer_query(documents, query, memory_manager=None):
+    try:
+        refined_query = cached if refinement is None else refinement.result()
+    except Exception as e:
+        print(f"Query refinement failed: {e}")
+        return raw_docs
+
+    if refined_query.strip().lower() == query.strip().lower():
+        return raw_docs
+    # The rewrite carries the conversational context, so its hits lead the merge
+    return merge_results(retrieve_docs(refined_query, db_to_use, k, filters), raw_docs, k=k)
+
+
+def answer_query(documents, query, memory_manager=None, with_reasoning=False):
+    """Answer from the documents; with_reasoning=True returns (answer, reasoning)"""
     context = get_context(documents)
     prompt = get_enhanced_prompt()
-    chain = prompt | llm_model
+    chain = prompt | get_llm()
 
     memory_vars = {}
     if memory_manager:
         memory = memory_manager.get_memory()
         memory_vars = {"chat_history": memory.get("chat_history", "")}
 
-    response = chain.invoke({
-        "question": query,
-        "context": context,
-        **memory_vars
-    })
+    with span("answer_query.groq"):
+        response = chain.invoke({
+            "question": query,
+            "context": context,
+            **memory_vars
+        })
+
+    # Only the final answer is kept; reasoning traces would be resent every turn
+    answer, reasoning = split_reasoning(response.content)
 
     if memory_manager:
-        memory_manager.add_to_memory(query, response.content)
+        memory_manager.add_to_memory(query, answer)
+
+    if with_reasoning:
+        return answer, reasoning
+    return answer
 
-    return response.content
 
+def get_upload_index(uploaded_file):
+    """Return the session's background index for this upload, starting it if needed"""
+    file_key = (uploaded_file.name, uploaded_file.size)
+    if st.session_state.get('user_db_key') != file_key:
+        st.session_state.user_db = ProgressiveIndex(save_upload(uploaded_file)).start()
+        st.session_state.user_db_key = file_key
+    return st.session_state.user_db
 
-def process_user_query(uploaded_file, query, memory_manager=None):
+
+def process_user_query(uploaded_file, query, memory_manager=None, with_reasoning=False):
     if not uploaded_file:
         raise ValueError("No file uploaded")
 
-    if 'user_db' not in st.session_state:
-        with st.spinner("Processing your document..."):
-            st.session_state.user_db = process_user_pdf(uploaded_file)
+    user_db = get_upload_index(uploaded_file)
+    if not user_db.is_complete:
+        with st.spinner("Indexing the first pages of your document..."):
+            user_db.wait_until_searchable(UPLOAD_FIRST_BATCH_TIMEOUT)
+    if user_db.db is None:
+        raise ValueError(user_db.error or "Your document is still being indexed, please try again shortly")
+
+    # The upload is searched as one more shard next to the knowledge base
+    search_db = get_federated_store([("upload", user_db)]) if FEDERATE_UPLOADS_WITH_KB else user_db
+    retrieved_docs = retrieve_docs_with_refinement(query, search_db, memory_manager)
+    answer, reasoning = answer_query(retrieved_docs, query, memory_manager, with_reasoning=True)
+
+    note = user_db.coverage_note()
+    if note:
+        answer = f"{answer}\n\n_ℹ️ {note}_"
 
-    retrieved_docs = retrieve_docs(query, st.session_state.user_db)
-    return answer_query(retrieved_docs, query, memory_manager)
+    if with_reasoning:
+        return answer, reasoning
+    return answer
 
 
 def _documents_are_relevant(documents, query):
@@ -101,29 +231,39 @@ def should_use_gemini(retrieved_docs: list, rag_response: str) -> tuple[bool, st
     return (False, "")
 
 
-def answer_query_with_fallback(documents, query, memory_manager=None):
+def answer_query_with_fallback(documents, query, memory_manager=None, with_reasoning=False):
+    """Answer with the RAG chain, falling back to Gemini; with_reasoning=True returns (answer, reasoning)"""
+    reasoning = ""
     # First check if documents are irrelevant
     if documents and not _documents_are_relevant(documents, query):
         use_gemini = True
         rag_response = "I couldn't find relevant information in the provided documents."
     else:
-        context = get_context(documents) if documents else None
-        rag_response = answer_query(documents, query, memory_manager)
+        rag_response, reasoning = answer_query(documents, query, memory_manager, with_reasoning=True)
         use_gemini, _ = should_use_gemini(documents, rag_response)
 
-    # Handle Gemini response if needed
-    if use_gemini and gemini.is_available():
+    incr("pipeline.answers")
+    response = rag_response
+    # Handle Gemini response if needed; the client is only built for a fallback
+    gemini = get_gemini() if use_gemini else None
+    if gemini and gemini.is_available():
+        incr("pipeline.gemini_fallback")
         context = get_context(documents) if documents else None
         gemini_response = gemini.generate_response(query, context)
 
         if "non-legal question" in gemini_response.lower():
-            return gemini_response
-        return f"{rag_response}\n\nAdditional information:\n{gemini_response}"
+            response = gemini_response
+        else:
+            response = f"{rag_response}\n\nAdditional information:\n{gemini_response}"
 
-    return rag_response
+    if with_reasoning:
+        return response, reasoning
+    return response
 
 
 def get_enhanced_prompt():
+    from langchain_core.prompts import PromptTemplate
+
     template = """
     You are an AI legal assistant. Use the following context to answer the question.
     If you don't know, say "I don't know based on the provided documents."
@@ -0,0 +1,39 @@
+import pytest
+from benchmarks.compare import flatten, higher_is_better
+
+
+@pytest.mark.parametrize("key", [
+    "ingestion[udhr.pdf].pages_per_s",
+    "ingestion[udhr.pdf].chunks_per_s",
+    "levels[8].throughput_per_s",
+    "results[0].recall@1",
+    "results[0].recall@10",
+    "results[0].mrr",
+    "retrieval[50000].coarse_to_fine_overlap",
+    "results[2].exact_overlap@4",
+    "results[2].rescored_overlap@4",
+])
+def test_higher_is_better(key):
+    assert higher_is_better(key)
+
+
+@pytest.mark.parametrize("key", [
+    "retrieval[1000].p50_ms",
+    "retrieval[1000].flat_p95_ms",
+    "retrieval[1000].filtered_p99_ms",
+    "end_to_end.mean_ms",
+    "ingestion[udhr.pdf].embed_s",
+    "ingestion[udhr.pdf].max_rss_mb",
+    "results[0].index_bytes",
+    "docstore.span_docstore_bytes",
+    "docstore.ratio",
+    "levels[8].error_rate",
+])
+def test_lower_is_better(key):
+    assert not higher_is_better(key)
+
+
+def test_flatten_labels_rows():
+    values = flatten({"retrieval": [{"index_size": 1000, "p50_ms": 1.2, "coarse_to_fine_overlap": 0.99}]})
+    assert values == {"retrieval[1000].index_size": 1000, "retrieval[1000].p50_ms": 1.2,
+                      "retrieval[1000].coarse_to_fine_overlap": 0.99}
@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("numpy")
+from langchain_core.documents import Document
+from utils.dedup import ChunkDeduplicator
+
+PASSAGE = "Everyone has the right to life, liberty and security of person under the law of the land. " * 3
+OPENING = "An unrelated opening passage about the scope and application of this Act to the territory."
+
+
+def chunk(text, source):
+    return Document(page_content=text, metadata={"source": source, "page": 0})
+
+
+def test_near_duplicates_are_recorded_on_the_canonical_chunk():
+    deduplicator = ChunkDeduplicator()
+    first = chunk(PASSAGE, "a.pdf")
+    with deduplicator.pending():
+        kept = deduplicator.deduplicate([first, chunk(PASSAGE.upper(), "b.pdf")])
+    assert kept == [first]
+    assert first.metadata["duplicate_sources"] == [{"source": "b.pdf", "page": 0}]
+
+
+def test_rolled_back_signatures_are_dropped():
+    deduplicator = ChunkDeduplicator()
+    opening = chunk(OPENING, "a.pdf")
+    with deduplicator.pending():
+        deduplicator.deduplicate([opening])
+
+    with pytest.raises(RuntimeError):
+        with deduplicator.pending():
+            kept = deduplicator.deduplicate([chunk(PASSAGE, "b.pdf"), chunk(OPENING, "b.pdf")])
+            assert len(kept) == 1 and opening.metadata["duplicate_sources"]
+            raise RuntimeError("embedding failed")
+
+    # The failed file's passage is not treated as seen, and its duplicate record is gone
+    assert "duplicate_sources" not in opening.metadata
+    assert len(deduplicator.signatures) == 1
+    with deduplicator.pending():
+        assert len(deduplicator.deduplicate([chunk(PASSAGE, "c.pdf")])) == 1
+
+
+def test_committed_signatures_are_kept():
+    deduplicator = ChunkDeduplicator()
+    with deduplicator.pending():
+        deduplicator.deduplicate([chunk(PASSAGE, "a.pdf")])
+    with pytest.raises(RuntimeError):
+        with deduplicator.pending():
+            raise RuntimeError("later file failed")
+    assert deduplicator.deduplicate([chunk(PASSAGE, "b.pdf")]) == []
@@ -0,0 +1,30 @@
+import os
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_text_splitters")
+from utils.hierarchical_index import section_key
+
+UDHR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base",
+                    "universal_declaration_of_human_rights.pdf")
+
+
+def test_section_key_prefers_outermost_heading():
+    assert section_key({"heading_path": "Part II > Section 3", "page": 4}) == "Part II"
+    assert section_key({"heading_path": "Article 5", "page": 1}) == "Article 5"
+    assert section_key({"heading_path": "", "page": 2}) == "page 2"
+
+
+def test_udhr_articles_are_separate_sections():
+    pytest.importorskip("fitz")
+    from vector_database import create_chunks, document_metadata, load_pdf
+
+    chunks = create_chunks(load_pdf(UDHR), strategy="legal")
+    for chunk in chunks:
+        chunk.metadata.update(document_metadata(UDHR))
+    sections = {section_key(chunk.metadata) for chunk in chunks}
+
+    assert chunks[0].metadata["jurisdiction"] == "International"
+    # One section per article (the PDF spells the first "Article I"), not one Preamble section
+    assert "Preamble" in sections
+    assert len({section for section in sections if section.startswith("Article ")}) == 30
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import pytest
+from utils.job_queue import JobQueue, PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def dead_pid():
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+def test_claim_takes_highest_priority_then_oldest(queue):
+    bulk = queue.submit("build_kb", {}, priority=PRIORITY_BULK)
+    upload = queue.submit("index_upload", {"file_path": "a.pdf"}, priority=PRIORITY_INTERACTIVE)
+    later_bulk = queue.submit("build_shard", {"name": "laws"}, priority=PRIORITY_BULK)
+
+    job = queue.claim(os.getpid())
+    assert job["id"] == upload and job["status"] == "running" and job["attempts"] == 1
+    assert job["payload"] == {"file_path": "a.pdf"}
+    assert [queue.claim(os.getpid())["id"] for _ in range(2)] == [bulk, later_bulk]
+    assert queue.claim(os.getpid()) is None
+
+
+def test_failed_job_is_retried_until_max_attempts(queue):
+    job_id = queue.submit("build_kb", {})
+    for attempt in (1, 2):
+        assert queue.claim(os.getpid())["attempts"] == attempt
+        queue.fail(job_id, "embedding server down", max_attempts=3)
+        job = queue.get(job_id)
+        assert job["status"] == "queued" and job["finished_at"] is None and job["worker_pid"] is None
+
+    assert queue.claim(os.getpid())["attempts"] == 3
+    queue.fail(job_id, "embedding server down", max_attempts=3)
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["finished_at"] and job["error"] == "embedding server down"
+    assert queue.claim(os.getpid()) is None
+
+
+def test_completed_job_keeps_its_result(queue):
+    job_id = queue.submit("build_kb", {})
+    queue.claim(os.getpid())
+    queue.complete(job_id, {"version": "v1"})
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["progress"] == 1 and job["result"] == {"version": "v1"}
+    assert queue.find_active("build_kb") is None
+
+
+def test_orphans_of_dead_workers_are_requeued(queue):
+    orphan = queue.submit("build_kb", {})
+    running = queue.submit("index_upload", {})
+    queue.claim(dead_pid())
+    queue.claim(os.getpid())
+
+    assert queue.requeue_orphans(max_attempts=2) == 1
+    assert queue.get(orphan)["status"] == "queued"
+    assert queue.get(orphan)["error"] == "Worker process died"
+    assert queue.get(running)["status"] == "running"
+
+    assert queue.claim(dead_pid())["id"] == orphan
+    assert queue.requeue_orphans(max_attempts=2) == 1
+    job = queue.get(orphan)
+    assert job["status"] == "failed" and job["finished_at"]
+
+
+def test_find_active_matches_payload_and_skips_excluded(queue):
+    laws = queue.submit("build_shard", {"name": "laws"})
+    queue.submit("build_shard", {"name": "cases"})
+    assert queue.find_active("build_shard", name="laws")["id"] == laws
+    assert queue.find_active("build_shard", exclude_id=laws, name="laws") is None
+    assert queue.find_active("build_kb") is None
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+from langchain_core.documents import Document
+from utils.legal_chunker import LegalChunker
+
+DECLARATION = """Universal Declaration of Human Rights
+Preamble
+Whereas recognition of the inherent dignity of all members of the human family is the foundation of freedom,
+Article 1
+All human beings are born free and equal in dignity and rights.
+Article 2
+Everyone is entitled to all the rights and freedoms set forth in this Declaration.
+"""
+
+ACT = """PART I
+Section 1. Short title
+This Act may be cited as the Example Act.
+Section 2. Definitions
+In this Act, unless the context otherwise requires, words have their ordinary meaning.
+PART II
+Section 3. Application
+This Act applies to the whole country.
+SCHEDULE
+Forms referred to in section 3.
+"""
+
+
+def chunk(text):
+    pages = [Document(page_content=text, metadata={"source": "doc.pdf", "page": 0})]
+    return {doc.metadata["heading_path"]: doc for doc in LegalChunker(chunk_size=1000).split_documents(pages)}
+
+
+def test_preamble_does_not_enclose_articles():
+    chunks = chunk(DECLARATION)
+    assert set(chunks) == {"", "Preamble", "Article 1", "Article 2"}
+    assert chunks["Article 1"].metadata["provision"] == "Article 1"
+
+
+def test_parts_group_sections_and_schedule_stands_alone():
+    chunks = chunk(ACT)
+    assert set(chunks) == {"Part I > Section 1", "Part I > Section 2", "Part II > Section 3", "Part II > Schedule"}
+
+
+def test_heading_followed_by_a_numbered_subclause():
+    text = """Article 24
+Everyone has the right to rest and leisure.
+Article 25 (1) Everyone has the right to a standard of living adequate for health.
+(2) Motherhood and childhood are entitled to special care and assistance.
+Section 5(1) of the Act applies to such assistance.
+"""
+    chunks = chunk(text)
+    assert set(chunks) == {"Article 24", "Article 25"}
+    assert chunks["Article 25"].page_content.startswith("Article 25 (1) Everyone")
+    assert "Section 5(1) of the Act" in chunks["Article 25"].page_content
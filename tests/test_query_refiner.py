@@ -0,0 +1,31 @@
+import pytest
+from utils.query_refiner import QueryRefiner
+
+HISTORY = ["User: What does Article 17 of the UDHR say?", "Assistant: Everyone has the right to own property."]
+
+
+@pytest.mark.parametrize("query", [
+    "Does it apply to minors?",
+    "What about them?",
+    "And in India?",
+    "Is this the same in the UK?",
+    "Can their employer still dismiss them for the reasons listed above?",
+    "Explain more",
+])
+def test_follow_ups_need_refinement(query):
+    assert QueryRefiner().needs_refinement(query, HISTORY)
+
+
+@pytest.mark.parametrize("query", [
+    "Is there a right to own property?",
+    "Is it legal to record a phone call?",
+    "What rights does an accused person have during trial?",
+    "Is such a contract enforceable without a written agreement?",
+    "Are employers also required to pay overtime to contractors?",
+])
+def test_self_contained_questions_skip_refinement(query):
+    assert not QueryRefiner().needs_refinement(query, HISTORY)
+
+
+def test_first_question_is_never_refined():
+    assert not QueryRefiner().needs_refinement("Does it apply to minors?", [])
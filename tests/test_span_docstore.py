@@ -0,0 +1,64 @@
+import pickle
+import random
+import pytest
+
+pytest.importorskip("langchain_community")
+from langchain_core.documents import Document
+from utils.span_docstore import SpanDocstore
+
+HEADING = "Article 7\n"
+
+
+def round_trip(texts, source="doc.pdf"):
+    docs = {str(i): Document(page_content=text, metadata={"source": source, "page": 0})
+            for i, text in enumerate(texts)}
+    store = SpanDocstore()
+    store.add(docs)
+    store = pickle.loads(pickle.dumps(store))
+    for doc_id, doc in docs.items():
+        assert store.search(doc_id).page_content == doc.page_content
+        assert store.metadata(doc_id) == doc.metadata
+    return store
+
+
+def test_overlapping_chunks_share_text():
+    text = " ".join(f"word{i}" for i in range(200))
+    chunks = [text[start:start + 300] for start in range(0, len(text), 250)]
+    store = round_trip(chunks)
+    assert store.text_bytes == len(text.encode("utf-8"))
+
+
+def test_continuations_share_heading_and_overlap():
+    body = "All are equal before the law and are entitled without any discrimination to equal protection. " * 6
+    chunks = [HEADING + body[:200], HEADING + body[150:400], HEADING + body[350:]]
+    store = round_trip(chunks)
+    assert store.text_bytes < sum(len(chunk) for chunk in chunks) - 2 * len(HEADING)
+
+
+def test_overlap_reaching_into_the_heading_is_not_shared():
+    first = HEADING + "x" * 40
+    # The second continuation starts with a suffix of the previous chunk that includes its heading line
+    chunks = [first, HEADING + "y" * 40, HEADING + "Article 7\n" + "y" * 40 + "z" * 5]
+    round_trip(chunks)
+
+
+def test_multibyte_text_and_sources():
+    chunks = ["Everyone — without distinction — has rights. " * 3, "rights. Ünïcødé text follows here and here",
+              "Préambule\nConsidérant que la reconnaissance de la dignité", "Préambule\nla dignité inhérente à tous"]
+    round_trip(chunks)
+    round_trip(chunks[:2] + ["Preamble\nfrom another file entirely"], source="other.pdf")
+
+
+def test_random_chunks_round_trip():
+    rng = random.Random(7)
+    for _ in range(200):
+        texts, previous = [], ""
+        for _ in range(rng.randint(1, 6)):
+            piece = "".join(rng.choice("ab\né ") for _ in range(rng.randint(0, 60)))
+            if previous and rng.random() < 0.5:
+                piece = previous[-rng.randint(0, len(previous)):] + piece
+            if rng.random() < 0.5:
+                piece = rng.choice([HEADING, "ab\n"]) + piece
+            texts.append(piece)
+            previous = piece
+        round_trip(texts)
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config import ANALYTICS_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS hourly_counters (
+    hour TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, name)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    rating TEXT,
+    comment TEXT NOT NULL
+);
+"""
+
+RATINGS = ("good", "bad", "neutral")
+
+
+def _hour(moment=None):
+    return (moment or datetime.now()).strftime("%Y-%m-%dT%H")
+
+
+class AnalyticsStore:
+    """
+    Usage and feedback counters kept in SQLite across sessions. Every chat message
+    or feedback updates running totals and the current hour's bucket, so aggregates
+    cost the same however long the history gets.
+    """
+
+    def __init__(self, db_path=ANALYTICS_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _add(self, changes: Dict[str, int], comment: Optional[tuple] = None,
+             moment: Optional[datetime] = None, earlier: Optional[tuple] = None):
+        """Apply changes to the totals and the bucket of moment's hour, and earlier's (moment, changes) to its own"""
+        buckets = [(_hour(moment), changes)]
+        if earlier:
+            buckets.append((_hour(earlier[0]), earlier[1]))
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for hour, deltas in buckets:
+                    for name, delta in deltas.items():
+                        conn.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                                     "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, delta))
+                        conn.execute("INSERT INTO hourly_counters (hour, name, value) VALUES (?, ?, ?) "
+                                     "ON CONFLICT(hour, name) DO UPDATE SET value = value + excluded.value",
+                                     (hour, name, delta))
+                if comment:
+                    conn.execute("INSERT INTO comments (created_at, rating, comment) VALUES (?, ?, ?)",
+                                 ((moment or datetime.now()).isoformat(), *comment))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def record_message(self, role):
+        self._add({"messages": 1, f"messages.{role}": 1})
+
+    def record_feedback(self, rating, comment="", previous_rating=None, rated_at=None, previous_rated_at=None):
+        """
+        Count a rating given at rated_at (default now); re-rating a message moves it
+        from its previous rating, which is taken out of the hour it was counted in
+        """
+        changes, earlier = {f"rating.{rating}": 1}, None
+        if previous_rating:
+            earlier = (previous_rated_at, {f"rating.{previous_rating}": -1})
+        else:
+            changes["feedback"] = 1
+        self._add(changes, (rating, comment) if comment else None, rated_at, earlier)
+
+    def totals(self, hours: Optional[int] = None) -> Dict[str, int]:
+        """Counter values over all time, or summed over the hourly buckets of the last hours"""
+        with self._connection() as conn:
+            if hours is None:
+                rows = conn.execute("SELECT name, value FROM counters").fetchall()
+            else:
+                since = _hour(datetime.now() - timedelta(hours=hours - 1))
+                rows = conn.execute("SELECT name, SUM(value) FROM hourly_counters WHERE hour >= ? GROUP BY name",
+                                    (since,)).fetchall()
+        return {name: int(value) for name, value in rows}
+
+    def recent_comments(self, limit=3, hours: Optional[int] = None) -> List[str]:
+        """Latest comments, oldest first"""
+        query, params = "SELECT comment FROM comments", []
+        if hours is not None:
+            query += " WHERE created_at >= ?"
+            params.append((datetime.now() - timedelta(hours=hours)).isoformat())
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._connection() as conn:
+            return [row[0] for row in reversed(conn.execute(query, params).fetchall())]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_analytics_store() -> AnalyticsStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AnalyticsStore()
+        return _store
@@ -0,0 +1,133 @@
+import hashlib
+import re
+from contextlib import contextmanager
+from typing import List
+import numpy as np
+from utils.metrics import incr
+
+# 16 bands of 8 rows put the LSH candidate threshold near 0.7 Jaccard; candidates
+# are then confirmed against the signature estimate with the configured threshold
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+SHINGLE_WORDS = 5
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Fixed seed: signatures must match across processes and resumed builds
+_random = np.random.RandomState(20240501)
+_PERM_A = _random.randint(1, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _random.randint(0, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+
+def shingles(text) -> List[str]:
+    words = TOKEN_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+
+
+def minhash_signature(text):
+    """MinHash signature of the word shingles of text, or None for text without words"""
+    hashed = {int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+              for shingle in shingles(text)}
+    if not hashed:
+        return None
+    values = np.fromiter(hashed, dtype=np.uint64, count=len(hashed))
+    permuted = (np.outer(_PERM_A, values) + _PERM_B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1)
+
+
+class ChunkDeduplicator:
+    """
+    Drops chunks whose text nearly duplicates one seen before (same boilerplate,
+    the same treaty in two PDFs, an amended act repeating its predecessor). The
+    first occurrence stays canonical and lists the others in duplicate_sources.
+    Keep one instance across all files of a build to catch cross-file copies, and
+    deduplicate inside pending() so a chunk whose embedding fails does not keep
+    suppressing its later copies.
+    """
+
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self.rows = NUM_PERMUTATIONS // LSH_BANDS
+        self.buckets = [{} for _ in range(LSH_BANDS)]
+        self.signatures = []
+        self.canonical = []
+        self._committed = 0  # signatures before this index survive a rollback
+        self._recorded = []  # canonical chunks given a duplicate_sources entry since the last commit
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(LSH_BANDS)]
+
+    def find_duplicate(self, signature):
+        """Index of a stored canonical chunk with estimated Jaccard >= threshold, or None"""
+        seen = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            for candidate in self.buckets[band].get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                    return candidate
+        return None
+
+    def deduplicate(self, chunks):
+        """Canonical chunks only; duplicates are recorded on the chunk they repeat"""
+        kept = []
+        for chunk in chunks:
+            signature = minhash_signature(chunk.page_content)
+            if signature is None:
+                kept.append(chunk)
+                continue
+            duplicate_of = self.find_duplicate(signature)
+            if duplicate_of is not None:
+                canonical = self.canonical[duplicate_of]
+                canonical.metadata.setdefault("duplicate_sources", []).append(
+                    {"source": chunk.metadata.get("source"), "page": chunk.metadata.get("page")})
+                self._recorded.append(canonical)
+                continue
+            index = len(self.signatures)
+            self.signatures.append(signature)
+            self.canonical.append(chunk)
+            for band, key in enumerate(self._band_keys(signature)):
+                self.buckets[band].setdefault(key, []).append(index)
+            kept.append(chunk)
+
+        if len(kept) < len(chunks):
+            incr("ingest.duplicate_chunks", len(chunks) - len(kept))
+        return kept
+
+    def commit(self):
+        """Keep the signatures and duplicates recorded since the last commit"""
+        self._committed = len(self.signatures)
+        self._recorded = []
+
+    def rollback(self):
+        """Forget the signatures and duplicates recorded since the last commit"""
+        for bucket in self.buckets:
+            for key in list(bucket):
+                indices = bucket[key]
+                while indices and indices[-1] >= self._committed:
+                    indices.pop()
+                if not indices:
+                    del bucket[key]
+        del self.signatures[self._committed:]
+        del self.canonical[self._committed:]
+        for canonical in reversed(self._recorded):
+            sources = canonical.metadata["duplicate_sources"]
+            sources.pop()
+            if not sources:
+                del canonical.metadata["duplicate_sources"]
+        self._recorded = []
+
+    @contextmanager
+    def pending(self):
+        """Commit what is deduplicated in the block if it completes (its chunks embedded), else roll it back"""
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
@@ -1,33 +1,50 @@
+import json
 import os
-import fitz  # PyMuPDF
-from pdf2image import convert_from_path
-import pytesseract
-from PIL import Image, ImageEnhance
-from langchain_community.document_loaders import (
-    PDFPlumberLoader,
-    Docx2txtLoader,
-    TextLoader,
-    UnstructuredFileLoader
-)
-from langchain.text_splitter import CharacterTextSplitter
+import re
+from utils import memory_budget
+from utils.metrics import incr, timed
+
+# PDF, OCR and LangChain loader libraries are imported inside the functions that
+# use them, so importing this module (and the app) stays cheap
 
 # Configure absolute paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TEMP_DIR = os.path.join(BASE_DIR, "temp_files")
-os.makedirs(TEMP_DIR, exist_ok=True)
 
 # Windows-specific configurations
 POPPLER_PATH = r"E:\GCEK 22-26\4th YEAR\SEM-7\Seminar\poppler-24.08.0\Library\bin"
 TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-# Configure OCR engines
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+# Pages are OCR'd at the lowest DPI first and only re-rendered at the next step, with
+# image enhancement, when the mean tesseract word confidence stays under the threshold
+OCR_DPI_STEPS = (200, 300, 400)
+OCR_PSM_MODES = (6, 11)  # uniform block of text, then sparse text
+OCR_MIN_CONFIDENCE = 70
+
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def normalize_whitespace(text):
+    """
+    Collapse runs of spaces within lines but keep line and paragraph breaks,
+    which the chunkers use to find headings and provision boundaries
+    """
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
 
-# Uncomment and configure for Windows if needed
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+def _get_pytesseract():
+    """Import pytesseract on first OCR use and point it at the configured binary"""
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return pytesseract
 
+
+@timed("ingest.is_scanned_pdf")
 def is_scanned_pdf(file_path):
     """Improved scanned PDF detection with better error handling"""
+    import fitz  # PyMuPDF
+
     try:
         with fitz.open(file_path) as doc:
             if len(doc) == 0:
@@ -45,6 +62,8 @@ def is_scanned_pdf(file_path):
 
 def enhance_image_for_ocr(image):
     """Pre-process image to improve OCR accuracy"""
+    from PIL import ImageEnhance
+
     try:
         # Convert to grayscale
         image = image.convert('L')
@@ -63,63 +82,149 @@ def enhance_image_for_ocr(image):
         return image
 
 
-def ocr_pdf(file_path):
-    """Robust OCR processing with image pre-processing"""
-    try:
-        # Create unique directory for this PDF
-        pdf_name = os.path.splitext(os.path.basename(file_path))[0]
-        pdf_temp_dir = os.path.join(TEMP_DIR, pdf_name)
-        os.makedirs(pdf_temp_dir, exist_ok=True)
-
-        # Convert PDF to images
-        images = convert_from_path(
-            file_path,
-            dpi=400,  # Higher resolution
-            output_folder=pdf_temp_dir,
-            fmt="jpeg",
-            thread_count=4,
-            poppler_path=POPPLER_PATH,
-            grayscale=True  # Convert to grayscale early
-        )
-
-        full_text = []
-        for i, image in enumerate(images, 1):
+def _ocr_image(pytesseract, image, psm):
+    """(text, mean word confidence) for one page image, keeping line and paragraph breaks"""
+    data = pytesseract.image_to_data(image, lang="eng", config=f"--oem 3 --psm {psm}",
+                                     output_type=pytesseract.Output.DICT)
+    lines, confidences = {}, []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if not word.strip() or confidence < 0:
+            continue
+        confidences.append(confidence)
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+
+    text, previous = [], None
+    for key, words in lines.items():
+        if previous and key[:2] != previous[:2]:
+            text.append("")  # blank line between paragraphs
+        text.append(" ".join(words))
+        previous = key
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return "\n".join(text), mean_confidence
+
+
+def _ocr_page(pytesseract, first_image, render, page_no):
+    """
+    OCR one page, escalating page segmentation mode and then DPI only while the
+    mean word confidence stays below OCR_MIN_CONFIDENCE; returns (text, settings)
+    """
+    best = None
+    attempts = 0
+    for step, dpi in enumerate(OCR_DPI_STEPS):
+        if step == 0:
+            image = first_image
+        else:
+            if not memory_budget.fits(memory_budget.ocr_page_mb(dpi)):
+                print(f"Page {page_no}: not enough memory to re-render at {dpi} dpi, keeping the best result")
+                break
+            incr("ocr.dpi_escalations")
+            image = enhance_image_for_ocr(render(page_no, dpi))
+        for psm in OCR_PSM_MODES:
+            attempts += 1
+            try:
+                text, confidence = _ocr_image(pytesseract, image, psm)
+            except Exception as e:
+                print(f"OCR of page {page_no} at {dpi} dpi, psm {psm} failed: {str(e)}")
+                continue
+            if text.strip() and (best is None or confidence > best[1]["confidence"]):
+                best = (text, {"page": page_no, "dpi": dpi, "psm": psm, "enhanced": step > 0,
+                               "confidence": round(confidence, 1)})
+            if best and best[1]["confidence"] >= OCR_MIN_CONFIDENCE:
+                best[1]["attempts"] = attempts
+                return best
+
+    if best is None:
+        return "", {"page": page_no, "dpi": None, "psm": None, "enhanced": False,
+                    "confidence": 0.0, "attempts": attempts}
+    best[1]["attempts"] = attempts
+    return best
+
+
+def ocr_pages(file_path, render_all=True):
+    """
+    (total pages, generator of (page number, text, settings)) for a scanned PDF,
+    yielding each page as soon as it is OCR'd. render_all=False renders one page at
+    a time even when the whole file would fit in memory, so the first page comes early.
+    """
+    import fitz  # PyMuPDF
+    from pdf2image import convert_from_path
+    pytesseract = _get_pytesseract()
+
+    # Create unique directory for this PDF
+    pdf_temp_dir = _ocr_temp_dir(file_path)
+    os.makedirs(pdf_temp_dir, exist_ok=True)
+
+    with fitz.open(file_path) as doc:
+        total_pages = len(doc)
+    first_dpi = OCR_DPI_STEPS[0]
+    page_mb = memory_budget.ocr_page_mb(first_dpi)
+    plan = memory_budget.plan_pages(total_pages, page_mb, f"OCR of {os.path.basename(file_path)}")
+
+    convert_options = dict(
+        output_folder=pdf_temp_dir,
+        fmt="jpeg",
+        poppler_path=POPPLER_PATH,
+        grayscale=True  # Convert to grayscale early
+    )
+
+    def render(page_no, dpi):
+        return convert_from_path(file_path, dpi=dpi, first_page=page_no, last_page=page_no,
+                                 **convert_options)[0]
+
+    def page_images():
+        if render_all and plan == "batch":
+            yield from enumerate(convert_from_path(file_path, dpi=first_dpi, thread_count=4,
+                                                   **convert_options), 1)
+            return
+        for page_no in range(1, total_pages + 1):
+            memory_budget.require(page_mb, f"OCR of page {page_no}")
+            yield page_no, render(page_no, first_dpi)
+
+    def pages():
+        for i, image in page_images():
             try:
-                # Enhance image quality
-                processed_image = enhance_image_for_ocr(image)
+                text, settings = _ocr_page(pytesseract, image, render, i)
+            except memory_budget.MemoryBudgetExceeded:
+                raise
+            except Exception as e:
+                print(f"Page {i} processing failed: {str(e)}")
+                continue
+            if text.strip():
+                print(f"Successfully extracted text from page {i} "
+                      f"({settings['dpi']} dpi, psm {settings['psm']}, confidence {settings['confidence']})")
+            else:
+                print(f"No text found on page {i}")
+            yield i, text, settings
 
-                # Save processed image for debugging
-                debug_img_path = os.path.join(pdf_temp_dir, f"processed_page_{i}.jpg")
-                processed_image.save(debug_img_path, "JPEG")
+    return total_pages, pages()
 
-                # Try multiple OCR configurations
-                configs = [
-                    "--psm 6",  # Assume uniform block of text
-                    "--psm 11",  # Sparse text
-                    "--oem 3"  # Default OCR engine mode
-                ]
 
-                for config in configs:
-                    try:
-                        text = pytesseract.image_to_string(
-                            processed_image,
-                            lang="eng",
-                            config=config
-                        )
-                        if text.strip():
-                            break
-                    except:
-                        continue
+def _ocr_temp_dir(file_path):
+    return os.path.join(TEMP_DIR, os.path.splitext(os.path.basename(file_path))[0])
+
+
+@timed("ingest.ocr_pdf")
+def ocr_pdf(file_path):
+    """
+    Confidence-driven OCR: every page is first read at the lowest DPI, and only
+    pages with low word confidence are retried with other settings. The settings
+    chosen per page are saved next to the text as ocr_settings.json.
+    """
+    try:
+        total_pages, pages = ocr_pages(file_path)
+        pdf_temp_dir = _ocr_temp_dir(file_path)
 
+        full_text, page_settings = [], []
+        with memory_budget.stage_memory("ingest.ocr_pdf"):
+            for i, text, settings in pages:
+                page_settings.append(settings)
                 if text.strip():
                     full_text.append(text)
-                    print(f"Successfully extracted text from page {i}")
-                else:
-                    print(f"No text found on page {i}")
 
-            except Exception as e:
-                print(f"Page {i} processing failed: {str(e)}")
-                continue
+        with open(os.path.join(pdf_temp_dir, "ocr_settings.json"), "w", encoding="utf-8") as f:
+            json.dump(page_settings, f, indent=2)
 
         if not full_text:
             print("Warning: No text extracted from any page")
@@ -133,13 +238,19 @@ def ocr_pdf(file_path):
         print(f"OCR results saved to: {ocr_text_path}")
         return ocr_text_path
 
+    except memory_budget.MemoryBudgetExceeded:
+        raise
     except Exception as e:
         print(f"OCR processing failed: {str(e)}")
         return None
 
 
+@timed("ingest.load_document")
 def load_document(file_path):
     """Document loader with comprehensive error handling and OCR text cleaning"""
+    from langchain_community.document_loaders import PDFPlumberLoader, Docx2txtLoader, TextLoader
+    from langchain.text_splitter import CharacterTextSplitter
+
     if not os.path.exists(file_path):
         print(f"File not found: {file_path}")
         return None
@@ -157,7 +268,7 @@ def load_document(file_path):
                         # --- Clean OCR text before loading ---
                         with open(ocr_path, "r", encoding="utf-8", errors="ignore") as f:
                             cleaned_text = f.read().replace('\x00', '').replace('\ufffd', '')
-                            cleaned_text = ' '.join(cleaned_text.split())  # normalize spaces
+                            cleaned_text = normalize_whitespace(cleaned_text)
 
                         with open(ocr_path, "w", encoding="utf-8") as f:
                             f.write(cleaned_text)
@@ -196,11 +307,53 @@ def load_document(file_path):
             print(f"Unsupported file type: {file_ext}")
             return None
 
+    except memory_budget.MemoryBudgetExceeded:
+        raise
     except Exception as e:
         print(f"Error loading {file_path}: {str(e)}")
         return None
 
 
+def open_document_pages(file_path):
+    """
+    Return (total_units, iterable) for a document so callers can index it page by page.
+    PDFs are read lazily one page at a time, scanned ones as each page is OCR'd;
+    other files fall back to load_document.
+    """
+    if file_path.lower().endswith(".pdf"):
+        import fitz  # PyMuPDF
+        from langchain_community.document_loaders import PDFPlumberLoader
+
+        try:
+            if is_scanned_pdf(file_path):
+                print(f"Processing scanned PDF page by page: {file_path}")
+                total_pages, pages = ocr_pages(file_path, render_all=False)
+                return total_pages, _ocr_documents(file_path, pages)
+            with fitz.open(file_path) as doc:
+                total_pages = len(doc)
+            return total_pages, PDFPlumberLoader(file_path).lazy_load()
+        except memory_budget.MemoryBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"Lazy PDF loading failed, loading whole file: {str(e)}")
+
+    documents = load_document(file_path) or []
+    return len(documents), documents
+
+
+def _ocr_documents(file_path, pages):
+    """One Document per OCR'd page, numbered from 0 like the PDF loaders"""
+    from langchain_core.documents import Document
+
+    while True:
+        with memory_budget.stage_memory("ingest.ocr_pdf"):
+            page = next(pages, None)
+        if page is None:
+            return
+        page_no, text, settings = page
+        yield Document(page_content=text, metadata={"source": file_path, "page": page_no - 1,
+                                                    "ocr_confidence": settings["confidence"]})
+
 
 def preprocess_documents(documents):
     """Enhanced document cleaning"""
@@ -213,7 +366,7 @@ def preprocess_documents(documents):
             # Advanced cleaning pipeline
             content = doc.page_content
             content = content.replace('\x00', '').replace('\ufffd', '')
-            content = ' '.join(content.split())  # Normalize whitespace
+            content = normalize_whitespace(content)
             doc.page_content = content
             processed.append(doc)
         except Exception as e:
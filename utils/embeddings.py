@@ -0,0 +1,171 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from utils.metrics import incr
+from config import (EMBEDDING_BACKEND, HASHING_EMBEDDING_DIM, OLLAMA_BASE_URL, OLLAMA_BULK_SLICE, OLLAMA_MODEL_NAME,
+                    PRETRAINED_DB_PATH, QUERY_PRIORITY_MAX_WAIT, QUERY_PRIORITY_WINDOW)
+
+EMBEDDING_FILE = "embedding.json"
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Frequent words that carry no meaning for retrieval, dropped before hashing
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which will with "
+    "shall may any such".split())
+
+_backends = {}
+_models = {}
+_models_lock = threading.Lock()
+
+
+class EmbeddingMismatch(ValueError):
+    """An index was built with a different embedding model than the one configured"""
+
+
+def register_backend(name, model_name):
+    """Add an embedding factory to the registry; model_name() names the model it builds"""
+    def decorator(factory):
+        _backends[name] = (factory, model_name)
+        return factory
+    return decorator
+
+
+@lru_cache(maxsize=200_000)
+def _hashed_term(term):
+    digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest[:4], "little"), 1.0 if digest[4] & 1 else -1.0
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    In-process CPU embedder: word unigrams and bigrams are hashed into dim signed
+    buckets weighted by sublinear term frequency, then L2-normalised. Stateless, so
+    documents and queries need no fitted vocabulary, and a query embeds in microseconds.
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def _embed(self, text):
+        tokens = [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+        terms = Counter(tokens)
+        terms.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term, count in terms.items():
+            bucket, sign = _hashed_term(term)
+            vector[bucket % self.dim] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+@register_backend("ollama", lambda: OLLAMA_MODEL_NAME)
+def _ollama_embeddings():
+    from langchain_ollama import OllamaEmbeddings
+    return OllamaEmbeddings(model=OLLAMA_MODEL_NAME, base_url=OLLAMA_BASE_URL)
+
+
+@register_backend("hashing", lambda: f"hashing-v1-{HASHING_EMBEDDING_DIM}")
+def _hashing_embeddings():
+    return HashingEmbeddings(HASHING_EMBEDDING_DIM)
+
+
+QUERY_ACTIVITY_FILE = os.path.join(os.path.dirname(PRETRAINED_DB_PATH), ".query_activity")
+
+
+def mark_query_activity():
+    """Record that a query is embedding now, for bulk embedding in any process to yield to"""
+    try:
+        os.utime(QUERY_ACTIVITY_FILE)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(QUERY_ACTIVITY_FILE), exist_ok=True)
+        open(QUERY_ACTIVITY_FILE, "a").close()
+
+
+def yield_to_queries(window=QUERY_PRIORITY_WINDOW, max_wait=QUERY_PRIORITY_MAX_WAIT):
+    """Wait while a query embedded within the last window seconds; False if max_wait ran out"""
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            if time.time() - os.path.getmtime(QUERY_ACTIVITY_FILE) >= window:
+                return True
+        except OSError:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+
+
+class PrioritizedEmbeddings(Embeddings):
+    """
+    Shares one model server between query and bulk embedding: queries mark their
+    activity, and bulk batches go out in small slices that wait while queries run
+    """
+
+    def __init__(self, embeddings, slice_size=OLLAMA_BULK_SLICE):
+        self.embeddings = embeddings
+        self.slice_size = slice_size
+
+    def embed_query(self, text):
+        mark_query_activity()
+        return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.slice_size):
+            if not yield_to_queries():
+                incr("embedding.bulk_priority_timeouts")
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + self.slice_size]))
+        return vectors
+
+
+def get_embeddings(backend=EMBEDDING_BACKEND):
+    """Shared embedding model of a registered backend"""
+    if backend not in _backends:
+        raise ValueError(f"Unknown embedding backend {backend!r}; available: {', '.join(sorted(_backends))}")
+    with _models_lock:
+        if backend not in _models:
+            _models[backend] = _backends[backend][0]()
+        return _models[backend]
+
+
+def embedding_identity(backend=EMBEDDING_BACKEND):
+    return {"backend": backend, "model": _backends[backend][1]()}
+
+
+def save_embedding_identity(db_path, dimensions=None, backend=EMBEDDING_BACKEND):
+    """Record which embedding model built the index in db_path"""
+    identity = embedding_identity(backend)
+    if dimensions:
+        identity["dimensions"] = int(dimensions)
+    os.makedirs(db_path, exist_ok=True)
+    with open(os.path.join(db_path, EMBEDDING_FILE), "w") as f:
+        json.dump(identity, f)
+
+
+def check_embedding_identity(db_path, backend=EMBEDDING_BACKEND):
+    """Raise EmbeddingMismatch unless the index in db_path was built with the configured model"""
+    path = os.path.join(db_path, EMBEDDING_FILE)
+    # Indexes from before the identity was recorded were all built by Ollama
+    recorded = {"backend": "ollama"}
+    if os.path.exists(path):
+        with open(path) as f:
+            recorded = json.load(f)
+    expected = embedding_identity(backend)
+    if any(recorded.get(key, expected[key]) != expected[key] for key in ("backend", "model")):
+        raise EmbeddingMismatch(
+            f"Index at {db_path} was built with {recorded.get('backend')}:{recorded.get('model', '?')}, "
+            f"but the configured embeddings are {expected['backend']}:{expected['model']}; rebuild it")
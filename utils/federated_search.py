@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from utils.metrics import span
+from config import FEDERATED_SEARCH_WORKERS
+
+# FAISS releases the GIL while scanning, so shards are searched in parallel
+_search_pool = ThreadPoolExecutor(max_workers=FEDERATED_SEARCH_WORKERS, thread_name_prefix="shard-search")
+
+
+def _faiss_of(store):
+    """The FAISS store behind a shard (a growing upload exposes its latest snapshot)"""
+    if hasattr(store, "refresh"):
+        return store.refresh().db
+    return store
+
+
+class FederatedStore:
+    """
+    Several independently built vector stores (the knowledge base, extra shards,
+    an upload) searched as one: every shard is queried with the same query vector,
+    distances are turned into [0, 1] relevance by each shard's own score function,
+    and the merged top-k is returned
+    """
+
+    def __init__(self, shards: List[Tuple[str, object]]):
+        self.shards = [(name, store) for name, store in shards if store is not None]
+
+    def __len__(self):
+        return len(self.shards)
+
+    @property
+    def embedding_function(self):
+        # Shards must share one embedding model for their scores to be comparable
+        for _, store in self.shards:
+            db = _faiss_of(store)
+            if db is not None:
+                return db.embedding_function
+        raise ValueError("No searchable shard")
+
+    def _search_shard(self, name, store, vector, k, filters):
+        db = _faiss_of(store)
+        if db is None:
+            return []
+        with span("retrieve.shard_search"):
+            # Shards with no chunk matching the filter return nothing without touching their vectors
+            from utils.metadata_index import search_with_filter
+            pairs = search_with_filter(db, vector, k, filters, with_scores=True)
+        relevance = db._select_relevance_score_fn()
+        return [(doc, relevance(score), name) for doc, score in pairs]
+
+    def search_with_scores(self, vector, k=4, filters=None):
+        """(document, relevance, shard name) for the merged top-k across shards"""
+        if len(self.shards) == 1:
+            name, store = self.shards[0]
+            results = self._search_shard(name, store, vector, k, filters)
+        else:
+            futures = [(name, _search_pool.submit(self._search_shard, name, store, vector, k, filters))
+                       for name, store in self.shards]
+            results = []
+            for name, future in futures:
+                try:
+                    results.extend(future.result())
+                except Exception as e:
+                    # One unavailable shard should not fail the whole search
+                    print(f"Search of shard {name} failed: {str(e)}")
+
+        merged, seen = [], set()
+        for doc, relevance, name in sorted(results, key=lambda result: -result[1]):
+            key = (doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content)
+            if key not in seen:
+                seen.add(key)
+                merged.append((doc, relevance, name))
+        return merged[:k]
+
+    def similarity_search_by_vector(self, vector, k=4, filters=None):
+        return [doc for doc, _, _ in self.search_with_scores(vector, k, filters)]
+
+    def similarity_search(self, query, k=4, filters=None):
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, filters)
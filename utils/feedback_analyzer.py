@@ -1,26 +1,30 @@
-import pandas as pd
-from typing import List, Dict
-import streamlit as st
+from collections import Counter
+from typing import Dict
 
 
 class FeedbackAnalyzer:
+    """Running rating and comment counts, updated as feedback arrives"""
+
     def __init__(self):
-        self.feedback_data = []
+        self.total_feedback = 0
+        self.rating_counts = Counter()
+        self.comment_counts = Counter()
 
     def add_feedback(self, feedback: Dict):
         """Add new feedback to analysis"""
-        self.feedback_data.append(feedback)
+        self.total_feedback += 1
+        self.rating_counts[feedback.get('rating')] += 1
+        self.comment_counts[feedback.get('comment')] += 1
 
     def get_stats(self) -> Dict:
         """Get feedback statistics"""
-        if not self.feedback_data:
+        if not self.total_feedback:
             return {}
 
-        df = pd.DataFrame(self.feedback_data)
         stats = {
-            'total_feedback': len(df),
-            'average_rating': df['rating'].value_counts().to_dict(),
-            'common_comments': df['comment'].value_counts().head(5).to_dict()
+            'total_feedback': self.total_feedback,
+            'average_rating': dict(self.rating_counts.most_common()),
+            'common_comments': dict(self.comment_counts.most_common(5))
         }
         return stats
 
@@ -1,20 +1,27 @@
 import os
 import json
-import requests
 from typing import Optional
-import google.generativeai as genai
 from tenacity import retry, stop_after_attempt, wait_exponential
 import time
+from utils.metrics import timed
 
 
 class GeminiIntegration:
     def __init__(self):
         self.api_key = self._load_api_key()
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-        else:
+        self._genai = None
+        if not self.api_key:
             print("❌ ERROR: No API key found")
 
+    @property
+    def genai(self):
+        """google.generativeai, imported and configured on first use (it is slow to import)"""
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+
     def _load_api_key(self) -> Optional[str]:
         """Load API key from config.json"""
         try:
@@ -25,17 +32,19 @@ class GeminiIntegration:
             print(f"Error loading API key: {e}")
             return None
 
+    @timed("gemini.is_available")
     def is_available(self) -> bool:
         """Check API availability"""
         if not self.api_key:
             return False
         try:
-            models = genai.list_models()
+            models = self.genai.list_models()
             return any(model.name.startswith('models/') for model in models)
         except Exception as e:
             print(f"API check failed: {e}")
             return False
 
+    @timed("gemini.generate_response")
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def generate_response(self, query: str, context: str = None) -> str:
         """Generate response using free model"""
@@ -44,7 +53,7 @@ class GeminiIntegration:
 
         try:
             prompt = self._build_prompt(query, context)
-            model = genai.GenerativeModel("gemini-1.5-flash")
+            model = self.genai.GenerativeModel("gemini-1.5-flash")
             response = model.generate_content(prompt)
             return self._format_legal_response(response.text)
         except Exception as e:
@@ -0,0 +1,129 @@
+import os
+import threading
+import numpy as np
+from utils.legal_chunker import PATH_SEPARATOR
+from config import HIERARCHICAL_RETRIEVAL, HIERARCHICAL_MIN_CHUNKS, HIERARCHY_DOC_FANOUT, HIERARCHY_SECTION_FANOUT
+
+HIERARCHY_FILE = "hierarchy.npz"
+
+_build_lock = threading.Lock()
+
+
+def section_key(metadata):
+    """
+    Outermost heading of a chunk: its Part or Chapter when it has one, else the
+    provision itself (Article 5), else its page
+    """
+    path = metadata.get("heading_path")
+    if path:
+        return path.split(PATH_SEPARATOR)[0]
+    return f"page {metadata.get('page', 0)}"
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def _top(scores, n):
+    if len(scores) <= n:
+        return np.arange(len(scores))
+    return np.argpartition(-scores, n - 1)[:n]
+
+
+class HierarchicalIndex:
+    """
+    Document and section summary vectors (normalised means of their chunk vectors)
+    over a FAISS store. A query picks the nearest documents, then the nearest
+    sections within them, and only those sections' chunks are searched.
+    """
+
+    def __init__(self, size, doc_vectors, section_vectors, section_doc, section_offsets, positions):
+        self.size = size
+        self.doc_vectors = doc_vectors
+        self.section_vectors = section_vectors
+        self.section_doc = section_doc
+        # Chunk positions grouped by section: section s owns positions[offsets[s]:offsets[s + 1]]
+        self.section_offsets = section_offsets
+        self.positions = positions
+
+    @classmethod
+    def from_faiss(cls, db):
+        exact_vectors = getattr(db, "exact_vectors", None)
+        vectors = np.asarray(exact_vectors if exact_vectors is not None
+                             else db.index.reconstruct_n(0, db.index.ntotal), dtype=np.float32)
+        read_metadata = getattr(db.docstore, "metadata", None)
+
+        docs, sections, members = {}, {}, []
+        for position in sorted(db.index_to_docstore_id):
+            doc_id = db.index_to_docstore_id[position]
+            metadata = (read_metadata(doc_id) if read_metadata else db.docstore.search(doc_id).metadata) or {}
+            doc = docs.setdefault(os.path.basename(str(metadata.get("source"))), len(docs))
+            section = sections.setdefault((doc, section_key(metadata)), len(sections))
+            if section == len(members):
+                members.append([])
+            members[section].append(position)
+
+        section_doc = np.fromiter((doc for doc, _ in sections), dtype=np.int64, count=len(sections))
+        section_sums = np.stack([vectors[positions].sum(axis=0) for positions in members])
+        doc_sums = np.zeros((len(docs), vectors.shape[1]), dtype=np.float32)
+        np.add.at(doc_sums, section_doc, section_sums)
+        return cls(
+            size=db.index.ntotal,
+            doc_vectors=_unit_rows(doc_sums),
+            section_vectors=_unit_rows(section_sums),
+            section_doc=section_doc,
+            section_offsets=np.cumsum([0] + [len(positions) for positions in members]).astype(np.int64),
+            positions=np.concatenate([np.asarray(positions, dtype=np.int64) for positions in members])
+        )
+
+    def can_prune(self, doc_fanout, section_fanout):
+        return len(self.doc_vectors) > doc_fanout or len(self.section_vectors) > section_fanout
+
+    def candidates(self, query, doc_fanout=HIERARCHY_DOC_FANOUT, section_fanout=HIERARCHY_SECTION_FANOUT):
+        """Packed bitmap (little-endian, as faiss.IDSelectorBitmap reads it) of the chunks in the nearest sections"""
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        nearest_docs = _top(self.doc_vectors @ query, doc_fanout)
+        sections = np.flatnonzero(np.isin(self.section_doc, nearest_docs))
+        sections = sections[_top(self.section_vectors[sections] @ query, section_fanout)]
+
+        mask = np.zeros(self.size, dtype=bool)
+        for section in sections:
+            mask[self.positions[self.section_offsets[section]:self.section_offsets[section + 1]]] = True
+        return np.packbits(mask, bitorder="little")
+
+    def save(self, directory):
+        np.savez(os.path.join(directory, HIERARCHY_FILE), size=self.size, doc_vectors=self.doc_vectors,
+                 section_vectors=self.section_vectors, section_doc=self.section_doc,
+                 section_offsets=self.section_offsets, positions=self.positions)
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(os.path.join(directory, HIERARCHY_FILE)) as state:
+            return cls(size=int(state["size"]), doc_vectors=state["doc_vectors"],
+                       section_vectors=state["section_vectors"], section_doc=state["section_doc"],
+                       section_offsets=state["section_offsets"], positions=state["positions"])
+
+
+def get_hierarchy(db):
+    """The store's hierarchical index, (re)built from its vectors if missing or stale"""
+    hierarchy = getattr(db, "hierarchy", None)
+    if hierarchy is None or hierarchy.size != db.index.ntotal:
+        with _build_lock:
+            hierarchy = getattr(db, "hierarchy", None)
+            if hierarchy is None or hierarchy.size != db.index.ntotal:
+                hierarchy = HierarchicalIndex.from_faiss(db)
+                db.hierarchy = hierarchy
+    return hierarchy
+
+
+def coarse_bitmap(db, query):
+    """Bitmap of the chunks worth scanning for query, or None to scan the whole index"""
+    if not HIERARCHICAL_RETRIEVAL or db.index.ntotal < HIERARCHICAL_MIN_CHUNKS:
+        return None
+    hierarchy = get_hierarchy(db)
+    if not hierarchy.can_prune(HIERARCHY_DOC_FANOUT, HIERARCHY_SECTION_FANOUT):
+        return None
+    return hierarchy.candidates(query)
@@ -0,0 +1,286 @@
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from utils.memory_budget import MemoryBudgetExceeded, reset_memory_report
+from utils.metrics import pid_alive, write_process_snapshot
+from config import JOB_QUEUE_DB, JOB_WORKERS, JOB_POLL_INTERVAL, JOB_MAX_ATTEMPTS
+
+# Job kind -> "module.function" run inside a worker process as handler(payload, context)
+JOB_HANDLERS = {
+    "build_kb": "vector_database.run_kb_build_job",
+    "index_upload": "vector_database.run_upload_index_job",
+    "build_shard": "vector_database.run_shard_build_job",
+}
+
+# Higher runs first: interactive uploads overtake bulk knowledge-base work
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BULK = 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    detail TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+"""
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+class JobQueue:
+    """Durable SQLite-backed job queue shared by the UI process and the worker processes"""
+
+    def __init__(self, db_path=JOB_QUEUE_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("payload", "detail", "result"):
+            job[field] = json.loads(job[field]) if job[field] else {}
+        return job
+
+    def submit(self, kind: str, payload: Dict, priority: int = PRIORITY_BULK) -> int:
+        """Queue a job and return its id"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, priority, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), priority, _now())
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker_pid: int) -> Optional[Dict]:
+        """Atomically take the highest-priority queued job"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (worker_pid, _now(), row["id"])
+            )
+            conn.execute("COMMIT")
+            return self.get(row["id"])
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def report_progress(self, job_id: int, progress: float, **detail):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, detail = ? WHERE id = ?",
+                (min(max(progress, 0.0), 1.0), json.dumps(detail), job_id)
+            )
+
+    def complete(self, job_id: int, result: Optional[Dict] = None):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', progress = 1, result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result or {}), _now(), job_id)
+            )
+
+    def fail(self, job_id: int, error: str, max_attempts: int = JOB_MAX_ATTEMPTS):
+        """Record a failure; the job is queued again until it has used up its attempts"""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "finished_at = CASE WHEN attempts < ? THEN NULL ELSE ? END, "
+                "error = ?, worker_pid = NULL WHERE id = ?",
+                (max_attempts, max_attempts, _now(), error, job_id)
+            )
+
+    def requeue_orphans(self, max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """Put back jobs whose worker process died mid-run, failing those that keep crashing workers"""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'").fetchall()
+            orphans = [row["id"] for row in rows if not row["worker_pid"] or not pid_alive(row["worker_pid"])]
+            for job_id in orphans:
+                conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                    "finished_at = CASE WHEN attempts < ? THEN NULL ELSE ? END, "
+                    "error = 'Worker process died', worker_pid = NULL WHERE id = ? AND status = 'running'",
+                    (max_attempts, max_attempts, _now(), job_id)
+                )
+        return len(orphans)
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with self._connection() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, kind: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Most recent jobs first, optionally of one kind"""
+        query, params = "SELECT * FROM jobs", []
+        if kind:
+            query += " WHERE kind = ?"
+            params.append(kind)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._connection() as conn:
+            return [self._to_dict(row) for row in conn.execute(query, params).fetchall()]
+
+    def find_active(self, kind: str, exclude_id: Optional[int] = None, **payload) -> Optional[Dict]:
+        """The oldest queued or running job of this kind, other than exclude_id, whose payload has these values"""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND status IN ('queued', 'running') AND id IS NOT ? ORDER BY id",
+                (kind, exclude_id)
+            ).fetchall()
+        for row in rows:
+            job = self._to_dict(row)
+            if all(job["payload"].get(key) == value for key, value in payload.items()):
+                return job
+        return None
+
+
+class JobContext:
+    """Handed to job handlers so they can report progress"""
+
+    def __init__(self, queue: JobQueue, job: Dict):
+        self.queue = queue
+        self.job_id = job["id"]
+        self.payload = job["payload"]
+        # 1 on the first run, higher when a failed or orphaned job is retried
+        self.attempt = job["attempts"]
+
+    def report(self, progress: float, **detail):
+        self.queue.report_progress(self.job_id, progress, **detail)
+
+
+def _resolve_handler(kind):
+    module_name, function_name = JOB_HANDLERS[kind].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def worker_main(db_path=JOB_QUEUE_DB, poll_interval=JOB_POLL_INTERVAL):
+    """Worker process loop: claim, run, record; exits when the parent process goes away"""
+    queue = JobQueue(db_path)
+    parent_pid = os.getppid()
+    pid = os.getpid()
+
+    while os.getppid() == parent_pid:
+        job = queue.claim(pid)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        # Stage figures in the job result cover this job only
+        reset_memory_report()
+        try:
+            result = _resolve_handler(job["kind"])(job["payload"], JobContext(queue, job))
+            queue.complete(job["id"], result)
+        except MemoryBudgetExceeded as e:
+            # Retrying cannot help; the message goes straight to the user
+            print(f"Job {job['id']} ({job['kind']}) rejected: {str(e)}")
+            queue.fail(job["id"], str(e), max_attempts=0)
+        except Exception as e:
+            print(f"Job {job['id']} ({job['kind']}) failed: {str(e)}")
+            queue.fail(job["id"], str(e))
+        write_process_snapshot()
+
+
+class WorkerPool:
+    """Pool of worker processes draining the job queue, so heavy CPU work leaves the UI process"""
+
+    def __init__(self, num_workers=JOB_WORKERS, db_path=JOB_QUEUE_DB):
+        self.num_workers = num_workers
+        self.db_path = db_path
+        self.processes = []
+
+    def start(self):
+        JobQueue(self.db_path).requeue_orphans()
+        context = multiprocessing.get_context("spawn")
+        for _ in range(self.num_workers):
+            process = context.Process(target=worker_main, args=(self.db_path,), daemon=True)
+            process.start()
+            self.processes.append(process)
+        return self
+
+    def ensure_alive(self):
+        """Replace workers that crashed (a bad PDF must not shrink the pool for good)"""
+        alive = [process for process in self.processes if process.is_alive()]
+        if len(alive) < len(self.processes):
+            JobQueue(self.db_path).requeue_orphans()
+            context = multiprocessing.get_context("spawn")
+            for _ in range(len(self.processes) - len(alive)):
+                process = context.Process(target=worker_main, args=(self.db_path,), daemon=True)
+                process.start()
+                alive.append(process)
+        self.processes = alive
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        self.processes = []
+
+
+_job_queue = None
+_worker_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
+
+
+def ensure_worker_pool() -> WorkerPool:
+    """Start the process-wide worker pool once, and keep it at full size"""
+    global _worker_pool
+    with _pool_lock:
+        if _worker_pool is None:
+            _worker_pool = WorkerPool().start()
+        else:
+            _worker_pool.ensure_alive()
+        return _worker_pool
@@ -0,0 +1,160 @@
+import bisect
+import re
+from typing import List, Tuple
+
+# Headings that open a provision, outermost first. Part/Chapter group provisions;
+# Article/Section/Clause are the provisions that become chunks. A Preamble or
+# Schedule stands on its own at provision level, so the next Article or Section
+# closes it instead of nesting under it.
+HEADING_LEVELS = {"Part": 0, "Chapter": 0, "Preamble": 1, "Schedule": 1,
+                  "Article": 1, "Section": 1, "Clause": 2}
+KIND_NAMES = {"preamble": "Preamble", "part": "Part", "chapter": "Chapter", "schedule": "Schedule",
+              "article": "Article", "art.": "Article", "section": "Section", "sec.": "Section",
+              "§": "Section", "clause": "Clause"}
+UNNUMBERED_KINDS = {"Preamble", "Schedule"}
+
+HEADING_RE = re.compile(
+    r"^[ \t]*(?:the[ \t]+)?(?P<ordinal>(?:first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth)[ \t]+)?"
+    r"(?P<kind>preamble|part|chapter|schedule|article|art\.|section|sec\.|§|clause)"
+    r"(?:(?:(?<=[§.])[ \t]*|[ \t]+)(?P<number>\d+[a-z]?|[ivxlc]+)\b)?(?P<rest>[^\n]*)$",
+    re.IGNORECASE | re.MULTILINE
+)
+ROMAN_RE = re.compile(r"[ivxlc]+", re.IGNORECASE)
+# Numbered sub-clauses: "(1)", "(a)", "(iv)", "1." at the start of a line
+SUBCLAUSE_RE = re.compile(r"^[ \t]*(?:\(\s*(?:\d+|[a-z]{1,4})\s*\)|\d+\.)[ \t]", re.IGNORECASE | re.MULTILINE)
+SUBCLAUSE_REF_RE = re.compile(r"\([^)\n]*\)\s*")
+# Longer lines are prose that happens to start with "Section 5 ...", not headings
+MAX_HEADING_CHARS = 120
+PATH_SEPARATOR = " > "
+
+
+def find_headings(text) -> List[Tuple[int, int, str]]:
+    """(offset, level, label) for every provision heading in text"""
+    headings = []
+    for match in HEADING_RE.finditer(text):
+        kind = KIND_NAMES[match.group("kind").lower()]
+        number = match.group("number")
+        rest = match.group("rest").strip()
+        if number is None and kind not in UNNUMBERED_KINDS:
+            continue
+        if len(match.group(0).strip()) > MAX_HEADING_CHARS:
+            continue
+        # "Article 3 Everyone has..." or "Section 2. Definitions" are headings; "Section 5 of the Act" is not
+        if rest and not (rest[0] in ".:-–—()" or rest[0].isupper()):
+            continue
+        # "Article 25 (1) Everyone has..." opens with its first sub-clause; "Section 5(1) of the Act" cites one
+        subclause = SUBCLAUSE_REF_RE.match(rest)
+        if subclause and rest[subclause.end():][:1].islower():
+            continue
+        if number and ROMAN_RE.fullmatch(number):
+            number = number.upper()
+        ordinal = (match.group("ordinal") or "").strip().title()
+        label = " ".join(part for part in (ordinal, kind, number) if part)
+        headings.append((match.start(), HEADING_LEVELS[kind], label))
+    return headings
+
+
+class LegalChunker:
+    """
+    Split legal texts into one chunk per provision (Article/Section/Clause), keeping
+    the heading path as metadata; provisions longer than chunk_size are split at
+    numbered sub-clauses, and texts without recognisable structure fall back to the
+    generic recursive splitter
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=200):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        self.chunk_size = chunk_size
+        self.fallback = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+
+    def split_documents(self, documents):
+        """Chunk each source separately, with its pages joined so provisions can span pages"""
+        by_source = {}
+        for doc in documents:
+            by_source.setdefault(doc.metadata.get("source"), []).append(doc)
+
+        chunks = []
+        for pages in by_source.values():
+            text, page_starts = self._join_pages(pages)
+            headings = find_headings(text)
+            if headings:
+                chunks.extend(self._split_provisions(text, headings, pages, page_starts))
+            else:
+                chunks.extend(self.fallback.split_documents(pages))
+        return chunks
+
+    @staticmethod
+    def _join_pages(pages):
+        parts, page_starts, offset = [], [], 0
+        for page in pages:
+            page_starts.append(offset)
+            parts.append(page.page_content)
+            offset += len(page.page_content) + 2
+        return "\n\n".join(parts), page_starts
+
+    def _split_provisions(self, text, headings, pages, page_starts):
+        from langchain_core.documents import Document
+
+        def make_chunk(content, offset, heading_path):
+            page_index = bisect.bisect_right(page_starts, offset) - 1
+            metadata = dict(pages[page_index].metadata)
+            metadata.update(heading_path=PATH_SEPARATOR.join(heading_path),
+                            provision=heading_path[-1] if heading_path else "",
+                            start_index=offset - page_starts[page_index])
+            return Document(page_content=content, metadata=metadata)
+
+        chunks = []
+        front_matter = text[:headings[0][0]].strip()
+        if front_matter:
+            chunks.extend(make_chunk(piece, offset, [])
+                          for piece, offset in self._split_oversized(front_matter, 0, ""))
+
+        stack = []  # (level, label) of the enclosing headings
+        boundaries = [offset for offset, _, _ in headings[1:]] + [len(text)]
+        for (start, level, label), end in zip(headings, boundaries):
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, label))
+
+            provision = text[start:end].strip()
+            heading_line, _, body = provision.partition("\n")
+            if not body.strip() and (level == 0 or label.split()[-1] in UNNUMBERED_KINDS):
+                continue  # a bare "PART III" or "SCHEDULE" heading only contributes to the path
+            path = [entry[1] for entry in stack]
+            chunks.extend(make_chunk(piece, offset, path)
+                          for piece, offset in self._split_oversized(provision, start, heading_line))
+        return chunks
+
+    def _split_oversized(self, provision, start, heading_line):
+        """(text, offset) pieces of about chunk_size, cut at sub-clause starts where possible"""
+        if len(provision) <= self.chunk_size:
+            return [(provision, start)]
+
+        cuts = [match.start() for match in SUBCLAUSE_RE.finditer(provision) if match.start() > 0]
+        bounds = [0] + cuts + [len(provision)]
+
+        # Pack consecutive sub-clauses into pieces of up to chunk_size
+        packed, current = [], None
+        for piece_start, piece_end in zip(bounds, bounds[1:]):
+            if current and piece_end - current[0] <= self.chunk_size:
+                current = (current[0], piece_end)
+            else:
+                if current:
+                    packed.append(current)
+                current = (piece_start, piece_end)
+        packed.append(current)
+
+        results = []
+        for index, (piece_start, piece_end) in enumerate(packed):
+            piece = provision[piece_start:piece_end].strip()
+            parts = [piece] if len(piece) <= self.chunk_size else self.fallback.split_text(piece)
+            search_from = piece_start
+            for part_no, part in enumerate(parts):
+                offset = provision.find(part, search_from)
+                search_from = offset + 1 if offset >= 0 else search_from
+                # Continuations repeat the heading line so each piece says which provision it belongs to
+                prefix = f"{heading_line}\n" if (index or part_no) and heading_line else ""
+                results.append((prefix + part, start + (offset if offset >= 0 else piece_start)))
+        return results
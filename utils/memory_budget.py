@@ -0,0 +1,173 @@
+import os
+import sys
+import threading
+import tracemalloc
+from typing import Dict, Optional
+from config import MEMORY_BUDGET_MB, MEMORY_PROFILING
+
+# Rough working-set estimates used to decide between batch and page-at-a-time ingestion.
+# A rendered page is width x height bytes in grayscale, held about three times over
+# while it is enhanced for OCR; pdfplumber keeps a few MB of layout objects per page.
+OCR_PAGE_COPIES = 3
+TEXT_PAGE_MB = 2.0
+# Allocation sites listed per stage in profiling mode
+TOP_ALLOCATIONS = 5
+
+_stage_reports = {}
+_reports_lock = threading.Lock()
+# Stages open in this thread, innermost last
+_open_stages = threading.local()
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a document cannot be ingested within MEMORY_BUDGET_MB"""
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process, or None where it cannot be read"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """High-water mark of the process RSS (not available on Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def ocr_page_mb(dpi) -> float:
+    """Estimated memory to render and enhance one letter-size page for OCR"""
+    return OCR_PAGE_COPIES * (8.5 * dpi) * (11 * dpi) / 2 ** 20
+
+
+def headroom_mb() -> Optional[float]:
+    """MB left under the budget, or None when there is no budget or RSS is unknown"""
+    rss = current_rss_mb()
+    if not MEMORY_BUDGET_MB or rss is None:
+        return None
+    return MEMORY_BUDGET_MB - rss
+
+
+def fits(estimated_mb) -> bool:
+    headroom = headroom_mb()
+    return headroom is None or estimated_mb <= headroom
+
+
+def require(estimated_mb, what):
+    """Raise MemoryBudgetExceeded with a user-facing message unless estimated_mb fits"""
+    headroom = headroom_mb()
+    if headroom is not None and estimated_mb > headroom:
+        raise MemoryBudgetExceeded(
+            f"{what} needs about {estimated_mb:.0f} MB but only {max(headroom, 0):.0f} MB of the "
+            f"{MEMORY_BUDGET_MB} MB memory budget is free. Try a smaller document or split it into parts.")
+
+
+def plan_pages(total_pages, page_mb, what) -> str:
+    """
+    "batch" when all pages fit in memory at once, "page" when only one page at a
+    time does; raises MemoryBudgetExceeded when not even a single page fits
+    """
+    if fits(total_pages * page_mb):
+        return "batch"
+    require(page_mb, f"{what} (one page at a time)")
+    print(f"{what}: {total_pages} pages exceed the memory budget, processing one page at a time")
+    return "page"
+
+
+class stage_memory:
+    """
+    Record RSS before/after and the peak RSS of an ingestion stage; in profiling
+    mode also the tracemalloc peak and the top allocation sites
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._started_tracing = False
+        # Highest tracemalloc peak seen before a nested stage reset it
+        self._carried_peak = 0
+
+    def __enter__(self):
+        self.rss_before = current_rss_mb()
+        self.peak_before = peak_rss_mb()
+        if MEMORY_PROFILING:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            stack = _stage_stack()
+            if stack:
+                # reset_peak() below wipes the enclosing stage's peak so far; it keeps a copy
+                outer = stack[-1]
+                outer._carried_peak = max(outer._carried_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        rss_after = current_rss_mb()
+        peak_after = peak_rss_mb()
+        # A raised high-water mark pins the stage peak; otherwise the larger endpoint is the best bound
+        candidates = [self.rss_before, rss_after]
+        if peak_after and self.peak_before and peak_after > self.peak_before:
+            candidates.append(peak_after)
+        peak = max((value for value in candidates if value is not None), default=None)
+
+        report = {"rss_before_mb": _round(self.rss_before), "rss_after_mb": _round(rss_after),
+                  "peak_rss_mb": _round(peak)}
+        if MEMORY_PROFILING and tracemalloc.is_tracing():
+            python_peak = max(tracemalloc.get_traced_memory()[1], self._carried_peak)
+            top = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+            report["python_peak_mb"] = _round(python_peak / 2 ** 20)
+            report["top_allocations"] = [str(stat) for stat in top]
+            stack = _stage_stack()
+            if self in stack:
+                stack.remove(self)
+            if stack:
+                stack[-1]._carried_peak = max(stack[-1]._carried_peak, python_peak)
+            if self._started_tracing:
+                tracemalloc.stop()
+        _record(self.name, report)
+        return False
+
+
+def _stage_stack():
+    if not hasattr(_open_stages, "stack"):
+        _open_stages.stack = []
+    return _open_stages.stack
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def _record(name, report):
+    with _reports_lock:
+        previous = _stage_reports.get(name)
+        if previous and (previous["peak_rss_mb"] or 0) > (report["peak_rss_mb"] or 0):
+            report["peak_rss_mb"] = previous["peak_rss_mb"]
+        report["calls"] = (previous or {}).get("calls", 0) + 1
+        _stage_reports[name] = report
+
+
+def memory_report() -> Dict:
+    """Per-stage memory figures recorded since the last reset (peak is the max over calls)"""
+    with _reports_lock:
+        return {name: dict(report) for name, report in _stage_reports.items()}
+
+
+def reset_memory_report():
+    """Start a fresh report, e.g. when a worker process picks up its next job"""
+    with _reports_lock:
+        _stage_reports.clear()
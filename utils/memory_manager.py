@@ -1,15 +1,102 @@
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import messages_to_dict, messages_from_dict
+from utils.response_parser import strip_reasoning
+from utils.metrics import timed
+from config import MEMORY_MODE, MEMORY_WINDOW_SIZE, MEMORY_TOKEN_BUDGET, SUMMARY_MODEL_NAME
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import pickle
 import os
 
 MEMORY_DIR = "../conversation_memory/"
-os.makedirs(MEMORY_DIR, exist_ok=True)
+
+# Share of the token budget the running summary may use before it is re-compressed
+SUMMARY_BUDGET_SHARE = 0.4
+
+# Summaries are written off the answer path; one fold per session runs at a time
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) good enough for budgeting"""
+    return len(text) // 4 + 1 if text else 0
+
+
+def _truncate_to_tokens(text, max_tokens, keep_tail=False):
+    """Trim text to roughly max_tokens, cutting on a word boundary"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    if keep_tail:
+        return "… " + text[-max_chars:].split(' ', 1)[-1]
+    return text[:max_chars].rsplit(' ', 1)[0] + " …"
+
+
+def render_messages(messages):
+    """Render chat messages as plain 'User:/Assistant:' lines for the prompt"""
+    lines = []
+    for msg in messages:
+        speaker = "User" if msg.type == "human" else "Assistant"
+        # Older sessions may still hold answers with reasoning traces
+        content = strip_reasoning(str(msg.content))
+        lines.append(f"{speaker}: {' '.join(content.split())}")
+    return "\n".join(lines)
+
+
+class ConversationSummarizer:
+    """Folds evicted conversation turns into a running summary using a small Groq model"""
+
+    def __init__(self, model_name=SUMMARY_MODEL_NAME):
+        self.model_name = model_name
+        self._llm = None
+
+    def _get_llm(self):
+        if self._llm is None:
+            from langchain_groq import ChatGroq
+            self._llm = ChatGroq(model=self.model_name, temperature=0)
+        return self._llm
+
+    def __call__(self, summary, new_lines, max_tokens):
+        from langchain_core.prompts import PromptTemplate
+
+        prompt = PromptTemplate.from_template("""
+        Progressively summarise a legal consultation. Extend the current summary with the
+        new lines, keeping facts, parties, jurisdictions and cited articles. Stay under
+        {max_words} words and return only the updated summary.
+
+        Current summary:
+        {summary}
+
+        New lines:
+        {new_lines}
+
+        Updated summary:
+        """)
+        response = (prompt | self._get_llm()).invoke({
+            "summary": summary or "(empty)",
+            "new_lines": new_lines,
+            "max_words": int(max_tokens * 0.75)
+        })
+        return response.content.strip()
+
 
 class MemoryManager:
-    def __init__(self, session_id="default", window_size=5):
+    def __init__(self, session_id="default", window_size=MEMORY_WINDOW_SIZE, mode=MEMORY_MODE,
+                 token_budget=MEMORY_TOKEN_BUDGET, summarizer=None):
         self.session_id = session_id
+        self.window_size = window_size
+        self.mode = mode
+        self.token_budget = token_budget
+        self.summarizer = summarizer or ConversationSummarizer()
+        self.summary = ""
+        # Evicted lines not yet in the summary: queued, and the batch being folded now
+        self._pending_lines = []
+        self._folding = ""
+        self._fold = None
+        self._generation = 0
+        # Re-entrant: a fold that has already finished applies itself from inside _start_fold
+        self._lock = threading.RLock()
+        self._rendered_history = None
         self.memory_file = os.path.join(MEMORY_DIR, f"{session_id}.pkl")
+        from langchain.memory import ConversationBufferWindowMemory
         self.memory = ConversationBufferWindowMemory(
             k=window_size,
             return_messages=True,
@@ -18,11 +105,19 @@ class MemoryManager:
         )
         self.load_memory()
 
+    @timed("memory.save_memory")
     def save_memory(self):
         """More robust memory saving"""
+        from langchain.schema import messages_to_dict
         try:
-            memory_dict = messages_to_dict(self.memory.chat_memory.messages)
+            with self._lock:
+                memory_dict = {
+                    "messages": messages_to_dict(self.memory.chat_memory.messages),
+                    "summary": self.summary,
+                    "pending": self._unsummarized()
+                }
             temp_file = f"{self.memory_file}.tmp"
+            os.makedirs(os.path.dirname(self.memory_file), exist_ok=True)
 
             with open(temp_file, 'wb') as f:
                 pickle.dump(memory_dict, f)
@@ -39,16 +134,27 @@ class MemoryManager:
 
     def load_memory(self):
         """More resilient memory loading"""
+        from langchain.schema import messages_from_dict
         if os.path.exists(self.memory_file):
             try:
                 with open(self.memory_file, 'rb') as f:
                     memory_dict = pickle.load(f)
 
+                # Older files hold a bare message list without a summary
+                summary, pending = "", ""
+                if isinstance(memory_dict, dict):
+                    summary = memory_dict.get("summary", "")
+                    pending = memory_dict.get("pending", "")
+                    memory_dict = memory_dict.get("messages")
+
                 # Validate loaded data
                 if isinstance(memory_dict, list):
                     messages = messages_from_dict(memory_dict)
                     if all(hasattr(msg, 'type') for msg in messages):
                         self.memory.chat_memory.messages = messages
+                        self.summary = summary
+                        self._pending_lines = [pending] if pending else []
+                        self._rendered_history = None
                         return
 
                 print("Invalid memory format, clearing memory")
@@ -64,22 +170,110 @@ class MemoryManager:
             {"question": user_input},
             {"answer": ai_response}
         )
+        if self.mode == "summary":
+            self._compact()
+        self._rendered_history = None
+        self.save_memory()
+
+    def _compact(self):
+        """Fold turns that fell out of the window (or overflow the budget) into the summary"""
+        messages = self.memory.chat_memory.messages
+        evicted = []
+
+        # Turns beyond the window always move into the summary
+        while len(messages) > self.window_size * 2:
+            evicted.extend(messages[:2])
+            messages = messages[2:]
+
+        # Then drop the oldest remaining turns until the verbatim part fits, keeping the latest turn
+        verbatim_budget = self.token_budget - min(estimate_tokens(self.summary),
+                                                  int(self.token_budget * SUMMARY_BUDGET_SHARE))
+        while len(messages) > 2 and estimate_tokens(render_messages(messages)) > verbatim_budget:
+            evicted.extend(messages[:2])
+            messages = messages[2:]
+
+        self.memory.chat_memory.messages = messages
+        if evicted:
+            with self._lock:
+                self._pending_lines.append(render_messages(evicted))
+                self._start_fold()
+
+    def _unsummarized(self):
+        return "\n".join(lines for lines in [self._folding, *self._pending_lines] if lines)
+
+    def _start_fold(self):
+        """Fold the queued lines into the summary in the background; call with the lock held"""
+        if self._fold is not None or not self._pending_lines:
+            return
+        self._folding = "\n".join(self._pending_lines)
+        self._pending_lines = []
+        summary_budget = int(self.token_budget * SUMMARY_BUDGET_SHARE)
+        generation = self._generation
+        self._fold = _summary_pool.submit(self.summarizer, self.summary, self._folding, summary_budget)
+        self._fold.add_done_callback(lambda fold: self._apply_fold(fold, generation))
+
+    def _apply_fold(self, fold, generation):
+        """Take a finished summary into the history used from the next turn on"""
+        summary_budget = int(self.token_budget * SUMMARY_BUDGET_SHARE)
+        with self._lock:
+            if generation != self._generation:
+                return
+            try:
+                self.summary = _truncate_to_tokens(fold.result(), summary_budget)
+            except Exception as e:
+                # Without the summariser keep the most recent evicted text instead
+                print(f"Error summarising memory: {e}")
+                summary = f"{self.summary}\n{self._folding}".strip()
+                self.summary = _truncate_to_tokens(summary, summary_budget, keep_tail=True)
+            self._folding = ""
+            self._fold = None
+            self._rendered_history = None
+            # Turns evicted while this fold ran go into the next one
+            self._start_fold()
         self.save_memory()
 
+    def get_chat_history(self):
+        """Plain-text history for the prompt, cached until the next turn is added"""
+        if self._rendered_history is None:
+            messages = self.memory.chat_memory.messages[-self.window_size * 2:]
+            history = render_messages(messages)
+            if self.mode == "summary":
+                with self._lock:
+                    earlier = self.summary
+                    unsummarized = self._unsummarized()
+                if unsummarized:
+                    # Turns still being summarised stand in verbatim, their latest part only
+                    room = max(int(self.token_budget * SUMMARY_BUDGET_SHARE) - estimate_tokens(earlier), 1)
+                    earlier = f"{earlier}\n{_truncate_to_tokens(unsummarized, room, keep_tail=True)}".strip()
+                if earlier:
+                    history = f"Summary of earlier conversation: {earlier}\n{history}".strip()
+                # Only an oversized latest turn can get here; keep its most recent part
+                history = _truncate_to_tokens(history, self.token_budget, keep_tail=True)
+            self._rendered_history = history
+        return self._rendered_history
+
     def get_memory(self):
         """Get current memory context"""
-        return self.memory.load_memory_variables({})
+        return {"chat_history": self.get_chat_history()}
 
     def clear_memory(self):
         """Clear conversation memory"""
         self.memory.chat_memory.clear()
+        with self._lock:
+            self.summary = ""
+            self._pending_lines = []
+            self._folding = ""
+            # A fold still running belongs to the cleared conversation; its result is dropped
+            self._fold = None
+            self._generation += 1
+        self._rendered_history = None
         self.save_memory()
 
 # Global dictionary to manage multiple memory sessions
 _memory_managers = {}
 
-def get_memory_manager(session_id="default", window_size=5):
+def get_memory_manager(session_id="default", window_size=MEMORY_WINDOW_SIZE):
     """Get or create a memory manager for a specific session"""
     if session_id not in _memory_managers:
         _memory_managers[session_id] = MemoryManager(session_id, window_size)
-    return _memory_managers[session_id]
\ No newline at end of file
+    return _memory_managers[session_id]
@@ -0,0 +1,195 @@
+import os
+import pickle
+import threading
+from typing import Dict, List
+import numpy as np
+from utils.hierarchical_index import coarse_bitmap
+from utils.vector_compression import is_compressed, rescore
+from config import RESCORE_OVERSAMPLE
+
+# Chunk metadata fields that can be filtered on
+FILTER_FIELDS = ("source", "doc_type", "jurisdiction", "page", "date")
+METADATA_INDEX_FILE = "metadata_index.pkl"
+
+_build_lock = threading.Lock()
+
+
+def field_value(metadata, field):
+    value = metadata.get(field)
+    # Sources are matched by file name, wherever the file was ingested from
+    if field == "source" and isinstance(value, str):
+        return os.path.basename(value)
+    return value
+
+
+def _satisfies(value, condition: Dict) -> bool:
+    """Evaluate {"$gte": 3, "$lt": 10}-style operators against one indexed value"""
+    try:
+        for operator, operand in condition.items():
+            if operator == "$eq" and not value == operand:
+                return False
+            if operator == "$ne" and not value != operand:
+                return False
+            if operator == "$in" and value not in operand:
+                return False
+            if operator == "$nin" and value in operand:
+                return False
+            if operator == "$gt" and not value > operand:
+                return False
+            if operator == "$gte" and not value >= operand:
+                return False
+            if operator == "$lt" and not value < operand:
+                return False
+            if operator == "$lte" and not value <= operand:
+                return False
+    except TypeError:
+        return False
+    return True
+
+
+class MetadataIndex:
+    """
+    For every filterable field and value, the FAISS positions of the chunks that
+    have it, turned into packed bitmaps on demand. A filter expression becomes one
+    bitmap that restricts the vector scan itself instead of post-filtering hits.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._positions = {field: {} for field in FILTER_FIELDS}
+        self._bitmaps = {}
+
+    @classmethod
+    def from_faiss(cls, db):
+        index = cls()
+        read_metadata = getattr(db.docstore, "metadata", None)
+        for position in sorted(db.index_to_docstore_id):
+            doc_id = db.index_to_docstore_id[position]
+            metadata = read_metadata(doc_id) if read_metadata else db.docstore.search(doc_id).metadata
+            index.add(position, metadata or {})
+        index.size = db.index.ntotal
+        return index
+
+    def add(self, position, metadata):
+        for field in FILTER_FIELDS:
+            value = field_value(metadata, field)
+            if value is not None:
+                self._positions[field].setdefault(value, []).append(position)
+        self.size = max(self.size, position + 1)
+        self._bitmaps.clear()
+
+    def values(self, field) -> List:
+        return sorted(self._positions[field], key=str)
+
+    def _bitmap(self, field, value):
+        key = (field, value)
+        if key not in self._bitmaps:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[self._positions[field].get(value, [])] = True
+            self._bitmaps[key] = np.packbits(mask, bitorder="little")
+        return self._bitmaps[key]
+
+    def _match(self, field, condition):
+        if field not in self._positions:
+            raise ValueError(f"Cannot filter on {field!r}; indexed fields are {', '.join(FILTER_FIELDS)}")
+        values = self._positions[field]
+        if isinstance(condition, dict):
+            if field == "source":
+                condition = {op: ([os.path.basename(v) for v in operand] if isinstance(operand, (list, tuple, set))
+                                  else os.path.basename(operand)) for op, operand in condition.items()}
+            selected = [value for value in values if _satisfies(value, condition)]
+        else:
+            wanted = condition if isinstance(condition, (list, tuple, set)) else [condition]
+            if field == "source":
+                wanted = [os.path.basename(value) for value in wanted]
+            selected = [value for value in wanted if value in values]
+
+        bitmap = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for value in selected:
+            bitmap |= self._bitmap(field, value)
+        return bitmap
+
+    def select(self, filters: Dict):
+        """
+        Packed bitmap (little-endian bit order, as faiss.IDSelectorBitmap reads it) of the
+        positions matching filters, e.g. {"source": "udhr.pdf", "page": {"$gte": 3}}
+        or {"$or": [{"jurisdiction": "IN"}, {"jurisdiction": "UK"}]}
+        """
+        result = None
+        for field, condition in filters.items():
+            if field in ("$and", "$or"):
+                parts = [self.select(part) for part in condition]
+                bitmap = parts[0].copy()
+                for part in parts[1:]:
+                    if field == "$and":
+                        bitmap &= part
+                    else:
+                        bitmap |= part
+            else:
+                bitmap = self._match(field, condition)
+            result = bitmap if result is None else result & bitmap
+        if result is None:
+            result = np.packbits(np.ones(self.size, dtype=bool), bitorder="little")
+        return result
+
+    def save(self, directory):
+        with open(os.path.join(directory, METADATA_INDEX_FILE), "wb") as f:
+            pickle.dump({"size": self.size, "positions": self._positions}, f)
+
+    @classmethod
+    def load(cls, directory):
+        index = cls()
+        with open(os.path.join(directory, METADATA_INDEX_FILE), "rb") as f:
+            state = pickle.load(f)
+        index.size = state["size"]
+        for field, values in state["positions"].items():
+            index._positions.setdefault(field, {}).update(values)
+        return index
+
+
+def get_metadata_index(db):
+    """The store's metadata index, (re)built from its docstore if missing or stale"""
+    index = getattr(db, "metadata_index", None)
+    if index is None or index.size != db.index.ntotal:
+        with _build_lock:
+            index = getattr(db, "metadata_index", None)
+            if index is None or index.size != db.index.ntotal:
+                index = MetadataIndex.from_faiss(db)
+                db.metadata_index = index
+    return index
+
+
+def search_with_filter(db, vector, k, filters=None, with_scores=False):
+    """
+    Top-k documents (or (document, distance) pairs) among those matching filters (all
+    chunks if None), restricted inside the FAISS scan. Large indexes only scan the
+    chunks of the sections nearest the query; compressed indexes return
+    RESCORE_OVERSAMPLE x k candidates that are re-ranked on the exact vectors.
+    """
+    import faiss
+
+    bitmap = None
+    if filters:
+        bitmap = get_metadata_index(db).select(filters)
+        if not bitmap.any():
+            return []
+    query = np.asarray([vector], dtype=np.float32)
+    if db._normalize_L2:
+        faiss.normalize_L2(query)
+
+    coarse = coarse_bitmap(db, query[0])
+    if coarse is not None:
+        scoped = coarse if bitmap is None else coarse & bitmap
+        # Too few chunks in the nearest sections (e.g. under a narrow filter): scan them all
+        if np.unpackbits(scoped).sum() >= k:
+            bitmap = scoped
+    params = None
+    if bitmap is not None:
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap)))
+    exact_vectors = getattr(db, "exact_vectors", None)
+    fetch = k * RESCORE_OVERSAMPLE if is_compressed(db) else k
+    distances, positions = db.index.search(query, fetch, params=params)
+    distances, positions = rescore(exact_vectors, db.index.metric_type, query[0], distances[0], positions[0], k)
+    results = [(db.docstore.search(db.index_to_docstore_id[int(position)]), float(distance))
+               for position, distance in zip(positions, distances)]
+    return results if with_scores else [doc for doc, _ in results]
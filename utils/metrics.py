@@ -0,0 +1,256 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+from typing import Dict, List
+from config import METRICS_ENABLED, METRICS_DIR, METRICS_EXPORT_INTERVAL
+
+# Histogram bucket upper bounds in seconds (Prometheus-style, cumulative on export)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Recent samples kept per stage for p50/p95/p99
+RESERVOIR_SIZE = 2048
+
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.bucket_counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+
+class MetricsRegistry:
+    """Process-local counters and latency histograms"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def snapshot(self) -> Dict:
+        """JSON-serialisable copy, mergeable with snapshots from worker processes"""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: {"buckets": list(h.bucket_counts), "count": h.count,
+                           "sum": h.total, "samples": list(h.samples)}
+                    for name, h in self.histograms.items()
+                }
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            registry.incr(f"{self.name}.errors")
+        return False
+
+
+def span(name):
+    """Time a block as a stage: `with span("retrieve.faiss_search"): ...`"""
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator form of span()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incr(name, value=1):
+    if METRICS_ENABLED:
+        registry.incr(name, value)
+
+
+def merge_snapshots(snapshots: List[Dict]) -> Dict:
+    merged = {"counters": {}, "histograms": {}}
+    for snap in snapshots:
+        for name, value in snap.get("counters", {}).items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + value
+        for name, hist in snap.get("histograms", {}).items():
+            target = merged["histograms"].setdefault(
+                name, {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "count": 0, "sum": 0.0, "samples": []})
+            target["buckets"] = [a + b for a, b in zip(target["buckets"], hist["buckets"])]
+            target["count"] += hist["count"]
+            target["sum"] += hist["sum"]
+            target["samples"].extend(hist["samples"])
+    return merged
+
+
+def write_process_snapshot():
+    """Worker processes drop their metrics here so the UI process can aggregate them"""
+    if not METRICS_ENABLED:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"process-{os.getpid()}.json")
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(temp_file, path)
+
+
+def pid_alive(pid):
+    """Whether a process with this id exists (it may belong to another user)"""
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def collect_snapshot() -> Dict:
+    """This process's metrics merged with the latest snapshots of the live worker processes"""
+    snapshots = [registry.snapshot()]
+    for path in glob.glob(os.path.join(METRICS_DIR, "process-*.json")):
+        match = re.search(r"process-(\d+)\.json$", path)
+        if not match or int(match.group(1)) == os.getpid():
+            continue
+        if not pid_alive(int(match.group(1))):
+            # Workers are terminated without a chance to clean up; their counts go with them
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, "r") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return merge_snapshots(snapshots)
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def latency_summary(snapshot: Dict = None) -> List[Dict]:
+    """Per-stage count and p50/p95/p99 in milliseconds"""
+    snapshot = snapshot or collect_snapshot()
+    rows = []
+    for name, hist in sorted(snapshot["histograms"].items()):
+        samples = hist["samples"]
+        rows.append({
+            "stage": name,
+            "count": hist["count"],
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+            "errors": snapshot["counters"].get(f"{name}.errors", 0)
+        })
+    return rows
+
+
+def ratio(snapshot: Dict, numerator: str, denominator: List[str]):
+    """Rate such as cache hits / (hits + misses); None until there is data"""
+    total = sum(snapshot["counters"].get(name, 0) for name in denominator)
+    return snapshot["counters"].get(numerator, 0) / total if total else None
+
+
+def _prom_name(name):
+    return "legal_assistant_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def render_prometheus(snapshot: Dict = None) -> str:
+    """Prometheus text exposition format"""
+    snapshot = snapshot or collect_snapshot()
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = _prom_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, hist in sorted(snapshot["histograms"].items()):
+        metric = _prom_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, hist["buckets"]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {hist["count"]}')
+        lines += [f"{metric}_sum {hist['sum']:.6f}", f"{metric}_count {hist['count']}"]
+    return "\n".join(lines) + "\n"
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_file_exporter(path=os.path.join(METRICS_DIR, "metrics.prom"), interval=METRICS_EXPORT_INTERVAL):
+    """Rewrite a Prometheus text file every interval seconds (for node_exporter's textfile collector)"""
+    global _exporter_started
+    with _exporter_lock:
+        if not METRICS_ENABLED or _exporter_started:
+            return
+        _exporter_started = True
+
+    def export_loop():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        while True:
+            try:
+                temp_file = f"{path}.tmp"
+                with open(temp_file, "w") as f:
+                    f.write(render_prometheus())
+                os.replace(temp_file, path)
+            except OSError as e:
+                print(f"Metrics export failed: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=export_loop, name="metrics-exporter", daemon=True).start()
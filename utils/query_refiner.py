@@ -1,20 +1,90 @@
+from collections import OrderedDict
+from hashlib import sha1
 from typing import List, Optional, Tuple
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from utils.gemini_integration import GeminiIntegration
+import re
+import threading
+from utils.response_parser import strip_reasoning
+from utils.metrics import incr, span
+from config import QUERY_REFINER_MODEL_NAME, QUERY_REFINER_CACHE_SIZE
+
+# Words that usually point back to earlier turns ("what about them", "the same clause", ...)
+CONTEXT_DEPENDENT_TERMS = {
+    "its", "this", "these", "those", "they", "them", "their",
+    "he", "she", "his", "her", "him", "above", "previous", "earlier", "same",
+    "former", "latter", "else", "again"
+}
+# Dummy subjects and adverbs that only point back in short follow-ups ("does it apply to minors?"),
+# not in questions that stand on their own ("is there a right to own property?")
+SHORT_QUERY_TERMS = {"it", "that", "there", "such", "also", "more"}
+SHORT_QUERY_WORDS = 6
+CONTEXT_DEPENDENT_OPENERS = ("and ", "but ", "so ", "what about", "how about", "then ", "why not")
 
 
 class QueryRefiner:
-    def __init__(self):
-        self.llm = ChatGroq(model="mixtral-8x7b-32768", temperature=0.3)
+    def __init__(self, cache_size=QUERY_REFINER_CACHE_SIZE):
+        self._llm = None
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # Shared by the refinement pool and every session's script thread
+        self._cache_lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_groq import ChatGroq
+            self._llm = ChatGroq(model=QUERY_REFINER_MODEL_NAME, temperature=0.3)
+        return self._llm
+
+    def needs_refinement(self, original_query: str, chat_history: List[str] = None) -> bool:
+        """
+        Cheap check: only follow-up questions that lean on earlier turns are worth an LLM rewrite
+        """
+        if not chat_history:
+            return False
+
+        query = original_query.strip().lower()
+        words = re.findall(r"[a-z']+", query)
+        if len(words) <= 3:
+            return True
+        if query.startswith(CONTEXT_DEPENDENT_OPENERS):
+            return True
+        if len(words) <= SHORT_QUERY_WORDS and any(word in SHORT_QUERY_TERMS for word in words):
+            return True
+        return any(word in CONTEXT_DEPENDENT_TERMS for word in words)
+
+    def _cache_key(self, original_query: str, chat_history: List[str]) -> Tuple[str, str]:
+        history_digest = sha1("\n".join(chat_history).encode("utf-8")).hexdigest()
+        return history_digest, original_query.strip()
+
+    def get_cached(self, original_query: str, chat_history: List[str] = None) -> Optional[str]:
+        """Return a previously refined query for this (history, query) pair, if any"""
+        if not chat_history:
+            return None
+        key = self._cache_key(original_query, chat_history)
+        with self._cache_lock:
+            refined = self._cache.get(key)
+            if refined is not None:
+                self._cache.move_to_end(key)
+        incr("refiner.cache_hit" if refined is not None else "refiner.cache_miss")
+        return refined
 
     def refine_query(self, original_query: str, chat_history: List[str] = None) -> str:
         """
         Enhance the original query with context from chat history
         """
-        if not chat_history:
+        if not self.needs_refinement(original_query, chat_history):
+            incr("refiner.skipped")
             return original_query
 
+        cached = self.get_cached(original_query, chat_history)
+        if cached is not None:
+            return cached
+        return self.rewrite(original_query, chat_history)
+
+    def rewrite(self, original_query: str, chat_history: List[str]) -> str:
+        """LLM rewrite of the query, cached; for callers that already missed the cache"""
+        from langchain_core.prompts import ChatPromptTemplate
+
         prompt = ChatPromptTemplate.from_template("""
         You are a legal query enhancement system. Improve the clarity and specificity
         of legal questions based on conversation history.
@@ -32,12 +102,18 @@ class QueryRefiner:
         chain = prompt | self.llm
         history_str = "\n".join(chat_history)
 
-        response = chain.invoke({
-            "history": history_str,
-            "query": original_query
-        })
+        with span("refine_query.groq"):
+            response = chain.invoke({
+                "history": history_str,
+                "query": original_query
+            })
 
-        return response.content.strip()
+        refined = strip_reasoning(response.content).strip().strip('"') or original_query
+        with self._cache_lock:
+            self._cache[self._cache_key(original_query, chat_history)] = refined
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return refined
 
 
 def should_use_gemini(retrieved_docs: list, rag_response: str) -> Tuple[bool, str]:
@@ -60,4 +136,4 @@ def should_use_gemini(retrieved_docs: list, rag_response: str) -> Tuple[bool, st
     if len(rag_response.split()) < 15:  # Slightly longer threshold
         return (True, "Response is too brief")
 
-    return (False, "")
\ No newline at end of file
+    return (False, "")
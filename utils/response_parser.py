@@ -0,0 +1,31 @@
+import re
+from typing import NamedTuple
+
+# DeepSeek-R1 style reasoning blocks; an unterminated block runs to the end of the text
+THINK_BLOCK_RE = re.compile(r"<think>(.*?)(?:</think>|$)", re.DOTALL | re.IGNORECASE)
+
+
+class ParsedResponse(NamedTuple):
+    answer: str
+    reasoning: str
+
+
+def split_reasoning(text: str) -> ParsedResponse:
+    """Separate <think>…</think> reasoning traces from the final answer"""
+    if not text:
+        return ParsedResponse("", "")
+
+    reasoning = [block.strip() for block in THINK_BLOCK_RE.findall(text) if block.strip()]
+    answer = THINK_BLOCK_RE.sub("", text)
+    # A stray closing tag means the opening one was cut off upstream
+    if "</think>" in answer.lower():
+        head, _, answer = re.split(r"(</think>)", answer, maxsplit=1, flags=re.IGNORECASE)
+        if head.strip():
+            reasoning.insert(0, head.strip())
+
+    return ParsedResponse(answer.strip(), "\n\n".join(reasoning))
+
+
+def strip_reasoning(text: str) -> str:
+    """Return only the final answer part of a model response"""
+    return split_reasoning(text).answer
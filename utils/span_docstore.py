@@ -0,0 +1,135 @@
+import threading
+from typing import Dict, List, Union
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# Shortest shared run treated as chunk overlap rather than a coincidental match
+MIN_OVERLAP = 16
+
+
+def _overlap(previous, text):
+    """Length of the longest suffix of previous that text starts with (0 if under MIN_OVERLAP)"""
+    probe = text[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    position = previous.find(probe, max(0, len(previous) - len(text)))
+    while position != -1:
+        if text.startswith(previous[position:]):
+            return len(previous) - position
+        position = previous.find(probe, position + 1)
+    return 0
+
+
+class SpanDocstore(Docstore, AddableMixin):
+    """
+    FAISS docstore that keeps the source text once, as one UTF-8 blob, and each
+    chunk as (start, end) byte spans into it. Consecutive overlapping chunks of a
+    source share their overlap, continuations of a long provision share the heading
+    line the legal chunker repeats on them, and chunk text is only decoded when a
+    hit is returned.
+    """
+
+    def __init__(self):
+        self._blob = b""
+        self._pending = []  # encoded text appended since the blob was last joined
+        self._size = 0
+        self._entries = {}  # id -> (spans, metadata)
+        # (source, tail, heading) of the last chunk stored, for overlap detection: tail is
+        # the part of its text at the end of the blob, heading (first line, its span) of
+        # the chunk that line was first stored with
+        self._last = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_faiss(cls, db):
+        """Copy a FAISS store's docstore in index order, so neighbouring chunks share overlaps"""
+        docstore = cls()
+        ids = [db.index_to_docstore_id[i] for i in sorted(db.index_to_docstore_id)]
+        docstore.add({doc_id: db.docstore.search(doc_id) for doc_id in ids})
+        return docstore
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            overlapping = set(texts).intersection(self._entries)
+            if overlapping:
+                raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+            for doc_id, doc in texts.items():
+                spans = self._append(doc.page_content, doc.metadata.get("source"))
+                self._entries[doc_id] = (spans, doc.metadata)
+
+    def _append(self, text, source):
+        spans, body, heading, overlap = [], text, None, 0
+        if self._last and self._last[0] == source:
+            tail, heading = self._last[1], self._last[2]
+            # A continuation starts with its provision's heading line; the rest may overlap the previous chunk
+            if heading and len(text) > len(heading[0]) and text.startswith(heading[0]):
+                spans.append(heading[1])
+                body = text[len(heading[0]):]
+            else:
+                heading = None
+            # Only the tail is contiguous with the end of the blob, so only it can be shared
+            overlap = _overlap(tail, body)
+        shared = len(body[:overlap].encode("utf-8"))
+        new = body[overlap:].encode("utf-8")
+        start = self._size - shared
+        self._pending.append(new)
+        self._size += len(new)
+        if spans and spans[-1][1] == start:
+            spans[-1] = (spans[-1][0], self._size)
+            body = text
+        else:
+            spans.append((start, self._size))
+
+        if heading is None and "\n" in text:
+            first_line = text[:text.index("\n") + 1]
+            heading = (first_line, (start, start + len(first_line.encode("utf-8"))))
+        self._last = (source, body, heading)
+        return tuple(spans)
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            entry = self._entries.get(search)
+            if entry is None:
+                return f"ID {search} not found."
+            if self._pending:
+                self._blob = b"".join([self._blob] + self._pending)
+                self._pending = []
+            spans, metadata = entry
+            text = b"".join(self._blob[start:end] for start, end in spans).decode("utf-8")
+        return Document(id=search, page_content=text, metadata=metadata)
+
+    def metadata(self, doc_id):
+        """Metadata of a chunk without decoding its text"""
+        entry = self._entries.get(doc_id)
+        return entry[1] if entry else None
+
+    def delete(self, ids: List) -> None:
+        """Forget the ids; their text stays in the blob until the index is rebuilt"""
+        with self._lock:
+            if not set(ids).intersection(self._entries):
+                raise ValueError(f"Tried to delete ids that does not exist: {ids}")
+            for doc_id in ids:
+                self._entries.pop(doc_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def text_bytes(self):
+        return self._size
+
+    def __getstate__(self):
+        with self._lock:
+            blob = b"".join([self._blob] + self._pending)
+            return {"blob": blob, "entries": self._entries, "last_tail": self._last}
+
+    def __setstate__(self, state):
+        self._blob = state["blob"]
+        self._pending = []
+        self._size = len(self._blob)
+        # Stores saved before chunks could have several spans hold (start, end, metadata)
+        self._entries = {doc_id: (((entry[0], entry[1]),), entry[2]) if len(entry) == 3 else entry
+                         for doc_id, entry in state["entries"].items()}
+        # Older stores recorded the last chunk's full text, which may not end the blob
+        self._last = state.get("last_tail")
+        self._lock = threading.Lock()
@@ -1,4 +1,5 @@
-from gemini_integration import GeminiIntegration
+# Run from the project root: python -m utils.test_gemini
+from utils.gemini_integration import GeminiIntegration
 
 
 def test_gemini():
@@ -0,0 +1,97 @@
+import json
+import os
+import numpy as np
+from config import VECTOR_COMPRESSION, PCA_DIMENSIONS
+
+COMPRESSION_FILE = "compression.json"
+EXACT_VECTORS_FILE = "vectors.f32.npy"
+COMPRESSION_PARTS = ("fp16", "int8", "pca")
+
+
+def parse_compression(mode):
+    """Set of parts in a mode like "fp16", "int8", "pca" or "pca+int8" ("none" is the empty set)"""
+    if not mode or mode == "none":
+        return set()
+    parts = set(mode.split("+"))
+    unknown = parts.difference(COMPRESSION_PARTS)
+    if unknown or {"fp16", "int8"} <= parts:
+        raise ValueError(f"Unknown vector compression {mode!r}; combine pca with at most one of fp16, int8")
+    return parts
+
+
+def compress_index(index, mode, pca_dimensions=PCA_DIMENSIONS):
+    """
+    A compact FAISS index holding the same vectors, in the same order and with the
+    same metric, as a flat index; also returns the full-precision vectors
+    """
+    import faiss
+
+    parts = parse_compression(mode)
+    vectors = index.reconstruct_n(0, index.ntotal)
+    dimensions = index.d
+    if "pca" in parts:
+        dimensions = max(1, min(pca_dimensions, index.d, len(vectors)))
+
+    if "fp16" in parts:
+        inner = faiss.IndexScalarQuantizer(dimensions, faiss.ScalarQuantizer.QT_fp16, index.metric_type)
+    elif "int8" in parts:
+        inner = faiss.IndexScalarQuantizer(dimensions, faiss.ScalarQuantizer.QT_8bit, index.metric_type)
+    else:
+        inner = faiss.IndexFlat(dimensions, index.metric_type)
+    # The PCA projection is part of the index, so queries are projected the same way
+    compact = faiss.IndexPreTransform(faiss.PCAMatrix(index.d, dimensions), inner) if "pca" in parts else inner
+    compact.train(vectors)
+    compact.add(vectors)
+    return compact, vectors
+
+
+def compress_store(db, db_path, mode=VECTOR_COMPRESSION, pca_dimensions=PCA_DIMENSIONS):
+    """
+    Swap a FAISS store's index for a compact one before it is saved to db_path. The
+    full-precision vectors go next to it, memory-mapped on load, for exact re-scoring.
+    """
+    if not parse_compression(mode):
+        return db
+    os.makedirs(db_path, exist_ok=True)
+    db.index, vectors = compress_index(db.index, mode, pca_dimensions)
+    vectors_path = os.path.join(db_path, EXACT_VECTORS_FILE)
+    np.save(vectors_path, vectors)
+    with open(os.path.join(db_path, COMPRESSION_FILE), "w") as f:
+        json.dump({"mode": mode, "dimensions": int(vectors.shape[1]), "pca_dimensions": pca_dimensions}, f)
+    db.exact_vectors = np.load(vectors_path, mmap_mode="r")
+    return db
+
+
+def attach_exact_vectors(db, db_path):
+    """Memory-map the full-precision vectors of a compressed store loaded from db_path"""
+    vectors_path = os.path.join(db_path, EXACT_VECTORS_FILE)
+    if os.path.exists(vectors_path):
+        db.exact_vectors = np.load(vectors_path, mmap_mode="r")
+    return db
+
+
+def is_compressed(db):
+    return getattr(db, "exact_vectors", None) is not None
+
+
+def rescore(exact_vectors, metric_type, query, distances, positions, k):
+    """
+    (distances, positions) of the k best candidates, re-ranked by exact distance to
+    their full-precision vectors; without vectors, just the k best candidates
+    """
+    import faiss
+
+    keep = positions >= 0
+    distances, positions = distances[keep], positions[keep]
+    if exact_vectors is None or not len(positions):
+        return distances[:k], positions[:k]
+    # Read the memory-mapped rows in file order
+    positions = np.sort(positions)
+    candidates = np.asarray(exact_vectors[positions], dtype=np.float32)
+    if metric_type == faiss.METRIC_INNER_PRODUCT:
+        exact = candidates @ query
+        best = np.argsort(-exact, kind="stable")[:k]
+    else:
+        exact = ((candidates - query) ** 2).sum(axis=1)
+        best = np.argsort(exact, kind="stable")[:k]
+    return exact[best], positions[best]
@@ -1,9 +1,22 @@
 # vector_database.py
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_ollama import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
-from utils.document_preprocessor import load_document, preprocess_documents
+# FAISS, LangChain and the numpy-backed index helpers are imported where they are
+# used, so importing this module (and rag_pipeline) stays cheap
+from utils.document_preprocessor import load_document, preprocess_documents, open_document_pages
+from utils.job_queue import get_job_queue, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from utils.memory_budget import TEXT_PAGE_MB, MemoryBudgetExceeded, fits, memory_report, require, stage_memory
+from utils.metrics import span, timed
 from config import *  # Import all constants from config
+from contextlib import nullcontext
+from datetime import datetime
+import hashlib
+import itertools
+import json
+import pickle
+import re
+import shutil
+import threading
+import time
+import uuid
 
 
 def load_pdf(file_path):
@@ -11,61 +24,768 @@ def load_pdf(file_path):
     return preprocess_documents(documents)
 
 
-def create_chunks(documents):
+def document_metadata(file_path):
+    """File-level filter fields: doc_type from the extension, plus any entry in KB_METADATA_FILE"""
+    metadata = {"doc_type": os.path.splitext(file_path)[1].lstrip(".").lower()}
+    try:
+        with open(KB_METADATA_FILE, "r", encoding="utf-8") as f:
+            metadata.update(json.load(f).get(os.path.basename(file_path), {}))
+    except (OSError, ValueError):
+        pass
+    return metadata
+
+
+@timed("ingest.chunking")
+def create_chunks(documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, strategy=CHUNKING_STRATEGY):
+    if strategy == "legal":
+        from utils.legal_chunker import LegalChunker
+        return LegalChunker(chunk_size, chunk_overlap).split_documents(documents)
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         add_start_index=True
     )
     return text_splitter.split_documents(documents)
 
 
+_embedding_model = None
+
+
 def get_embedding_model():
-    return OllamaEmbeddings(model=OLLAMA_MODEL_NAME)
+    """Embedding model of the configured EMBEDDING_BACKEND; Ollama traffic gives queries priority"""
+    global _embedding_model
+    if _embedding_model is None:
+        from utils.embeddings import PrioritizedEmbeddings, get_embeddings
+        embeddings = get_embeddings()
+        _embedding_model = PrioritizedEmbeddings(embeddings) if EMBEDDING_BACKEND == "ollama" else embeddings
+    return _embedding_model
+
+
+def compact_docstore(db):
+    """Replace the per-chunk text copies of a FAISS store with a SpanDocstore"""
+    from utils.span_docstore import SpanDocstore
+    if COMPACT_DOCSTORE and not isinstance(db.docstore, SpanDocstore):
+        db.docstore = SpanDocstore.from_faiss(db)
+    return db
 
 
 def create_vector_store(text_chunks, db_path=PRETRAINED_DB_PATH):
+    from langchain_community.vectorstores import FAISS
+    from utils.embeddings import save_embedding_identity
     embeddings = get_embedding_model()
-    faiss_db = FAISS.from_documents(text_chunks, embeddings)
+    faiss_db = compact_docstore(FAISS.from_documents(text_chunks, embeddings))
     faiss_db.save_local(db_path)
+    save_embedding_identity(db_path, faiss_db.index.d)
     return faiss_db
 
 
-def load_vector_store(db_path=PRETRAINED_DB_PATH):
+def load_vector_store(db_path=None):
+    from langchain_community.vectorstores import FAISS
+    from utils.embeddings import EmbeddingMismatch, check_embedding_identity
+    from utils.hierarchical_index import HierarchicalIndex
+    from utils.metadata_index import MetadataIndex
+    from utils.vector_compression import attach_exact_vectors
     embeddings = get_embedding_model()
+    db_path = db_path or get_active_kb_path()
     try:
-        return FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
+        check_embedding_identity(db_path)
+    except EmbeddingMismatch as e:
+        print(f"Not loading vector store: {str(e)}")
+        return None
+    try:
+        db = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
     except:
         return None
+    try:
+        db.metadata_index = MetadataIndex.load(db_path)
+    except (OSError, ValueError, pickle.UnpicklingError):
+        pass  # built from the docstore on the first filtered search
+    try:
+        db.hierarchy = HierarchicalIndex.load(db_path)
+    except (OSError, ValueError, KeyError):
+        pass  # built from the vectors on the first search that needs it
+    return attach_exact_vectors(db, db_path)
 
 
-def train_on_articles():
-    all_documents = []
+def get_active_kb_version():
+    """Name of the knowledge-base version the pointer file selects, or None"""
+    try:
+        with open(KB_CURRENT_POINTER, "r") as f:
+            version = json.load(f)["version"]
+        if os.path.isdir(os.path.join(KB_VERSIONS_DIR, version)):
+            return version
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
 
-    for filename in os.listdir(KNOWLEDGE_BASE_DIR):
-        if filename.lower().endswith('.pdf'):
-            file_path = os.path.join(KNOWLEDGE_BASE_DIR, filename)
-            try:
-                documents = load_pdf(file_path)
-                all_documents.extend(documents)
-            except Exception as e:
-                print(f"Error processing {filename}: {str(e)}")
-                continue
 
-    if not all_documents:
+def get_active_kb_path():
+    """Directory of the knowledge base serving queries (the legacy path before the first versioned build)"""
+    version = get_active_kb_version()
+    return os.path.join(KB_VERSIONS_DIR, version) if version else PRETRAINED_DB_PATH
+
+
+def list_kb_versions():
+    """Completed knowledge-base versions, newest first, with their manifests"""
+    if not os.path.isdir(KB_VERSIONS_DIR):
+        return []
+    versions = []
+    for name in sorted(os.listdir(KB_VERSIONS_DIR), reverse=True):
+        manifest_path = os.path.join(KB_VERSIONS_DIR, name, "manifest.json")
+        if name.startswith('.') or not os.path.exists(manifest_path):
+            continue
+        with open(manifest_path, "r") as f:
+            versions.append({"version": name, **json.load(f)})
+    return versions
+
+
+def activate_kb_version(version):
+    """Atomically point query serving at an existing version"""
+    if not os.path.isdir(os.path.join(KB_VERSIONS_DIR, version)):
+        raise ValueError(f"Unknown knowledge base version: {version}")
+    temp_file = f"{KB_CURRENT_POINTER}.tmp"
+    with open(temp_file, "w") as f:
+        json.dump({"version": version, "activated_at": datetime.now().isoformat()}, f)
+    os.replace(temp_file, KB_CURRENT_POINTER)
+
+
+def prune_kb_versions(keep=KB_KEEP_VERSIONS, current_job_id=None):
+    """
+    Delete old versions and abandoned staging directories, never the active one.
+    Called from a build job, pass its id so the job does not count as a build in progress.
+    """
+    active = get_active_kb_version()
+    for info in list_kb_versions()[keep:]:
+        if info["version"] != active:
+            shutil.rmtree(os.path.join(KB_VERSIONS_DIR, info["version"]), ignore_errors=True)
+    if get_job_queue().find_active("build_kb", exclude_id=current_job_id):
+        return
+    for name in os.listdir(KB_VERSIONS_DIR):
+        if name.startswith('.') and name.endswith('.building'):
+            shutil.rmtree(os.path.join(KB_VERSIONS_DIR, name), ignore_errors=True)
+
+
+def validate_vector_store(db_path, expected_chunks):
+    """Load a freshly built index and check it is complete and searchable"""
+    db = load_vector_store(db_path)
+    if db is None:
+        raise ValueError(f"Built index at {db_path} cannot be loaded")
+    if db.index.ntotal != expected_chunks or len(db.index_to_docstore_id) != expected_chunks:
+        raise ValueError(f"Built index has {db.index.ntotal} vectors and {len(db.index_to_docstore_id)} "
+                         f"documents, but the build produced {expected_chunks} chunks")
+    if not db.similarity_search("human rights", k=1):
+        raise ValueError("Built index returned no results for a test query")
+    return db
+
+
+def _reserve_kb_version():
+    """A new version name and its staging directory, created so concurrent builds cannot share it"""
+    base = datetime.now().strftime("v%Y%m%d-%H%M%S")
+    for attempt in itertools.count(1):
+        version = base if attempt == 1 else f"{base}-{attempt}"
+        staging_path = os.path.join(KB_VERSIONS_DIR, f".{version}.building")
+        if os.path.exists(os.path.join(KB_VERSIONS_DIR, version)):
+            continue
+        try:
+            os.mkdir(staging_path)
+            return version, staging_path
+        except FileExistsError:
+            continue
+
+
+def build_knowledge_base_version(progress_callback=None):
+    """Build the knowledge base into a new version directory, validate it and switch serving to it"""
+    os.makedirs(KB_VERSIONS_DIR, exist_ok=True)
+    version, staging_path = _reserve_kb_version()
+
+    try:
+        db = train_on_articles(staging_path, progress_callback, target=KB_SHARD_NAME)
+        validate_vector_store(staging_path, db.build_summary["chunks"])
+        with open(os.path.join(staging_path, "manifest.json"), "w") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "chunks": db.build_summary["chunks"],
+                "files": sorted(name for name, chunks in db.build_summary["files"].items() if chunks),
+                "compression": VECTOR_COMPRESSION
+            }, f, indent=2)
+        os.rename(staging_path, os.path.join(KB_VERSIONS_DIR, version))
+    except Exception:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+
+    activate_kb_version(version)
+    return version
+
+
+_serving_cache = {"path": None, "store": None}
+_serving_lock = threading.Lock()
+
+
+def get_serving_store():
+    """Shared vector store for the active knowledge-base version, reloaded after a swap"""
+    path = get_active_kb_path()
+    with _serving_lock:
+        if _serving_cache["path"] != path or _serving_cache["store"] is None:
+            store = load_vector_store(path)
+            if store is None:
+                return _serving_cache["store"]  # keep serving the old version
+            _serving_cache.update(path=path, store=store)
+        return _serving_cache["store"]
+
+
+def run_kb_build_job(payload, context):
+    """Job handler (worker process): build, validate and activate a new knowledge-base version"""
+    version = build_knowledge_base_version(
+        lambda progress, **detail: context.report(progress, **detail))
+    try:
+        prune_kb_versions(current_job_id=context.job_id)
+    except OSError as e:
+        print(f"Pruning old knowledge base versions failed: {str(e)}")
+    return {"version": version, "memory": memory_report()}
+
+
+def start_kb_rebuild():
+    """Queue a knowledge-base rebuild unless one is already queued or running; True if queued"""
+    queue = get_job_queue()
+    if queue.find_active("build_kb"):
+        return False
+    queue.submit("build_kb", {}, priority=PRIORITY_BULK)
+    return True
+
+
+def get_kb_rebuild_status():
+    """Latest knowledge-base build job, or None if there never was one"""
+    jobs = get_job_queue().list_jobs(kind="build_kb", limit=1)
+    return jobs[0] if jobs else None
+
+
+SHARD_NAME_RE = re.compile(r"[A-Za-z0-9_-]+")
+KB_SHARD_NAME = "knowledge_base"
+
+
+def list_shards():
+    """Manifests of the built shards, by name"""
+    if not os.path.isdir(SHARDS_DIR):
+        return []
+    shards = []
+    for name in sorted(os.listdir(SHARDS_DIR)):
+        manifest_path = os.path.join(SHARDS_DIR, name, "manifest.json")
+        if name.startswith(".") or not os.path.exists(manifest_path):
+            continue
+        with open(manifest_path) as f:
+            shards.append(dict(json.load(f), name=name))
+    return shards
+
+
+def build_shard(name, files, progress_callback=None, compression=VECTOR_COMPRESSION, current_job_id=None):
+    """
+    Build a shard from a subset of the knowledge-base files, replacing any shard of the same name.
+    Called from a build job, pass its id: only the oldest job building a name may run.
+    """
+    other = get_job_queue().find_active("build_shard", exclude_id=current_job_id, name=name)
+    if other and (current_job_id is None or other["id"] < current_job_id):
+        raise ValueError(f"Shard {name} is already being built by job {other['id']}")
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+    shard_path = os.path.join(SHARDS_DIR, name)
+    staging_path = os.path.join(SHARDS_DIR, f".{name}.building")
+
+    try:
+        db = train_on_articles(staging_path, progress_callback, files=files, compression=compression,
+                               target=f"shard:{name}")
+        validate_vector_store(staging_path, db.build_summary["chunks"])
+        with open(os.path.join(staging_path, "manifest.json"), "w") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "chunks": db.build_summary["chunks"],
+                "files": sorted(name for name, chunks in db.build_summary["files"].items() if chunks),
+                "compression": compression
+            }, f, indent=2)
+        if os.path.exists(shard_path):
+            retired_path = os.path.join(SHARDS_DIR, f".{name}.retired")
+            shutil.rmtree(retired_path, ignore_errors=True)
+            os.rename(shard_path, retired_path)
+            shutil.rmtree(retired_path, ignore_errors=True)
+        os.rename(staging_path, shard_path)
+    except Exception:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+    return name
+
+
+def drop_shard(name):
+    """Remove a shard; searches stop using it on their next call"""
+    shard_path = os.path.join(SHARDS_DIR, name)
+    if not SHARD_NAME_RE.fullmatch(name) or not os.path.isdir(shard_path):
+        raise ValueError(f"Unknown shard {name}")
+    shutil.rmtree(shard_path)
+
+
+def run_shard_build_job(payload, context):
+    """Job handler (worker process): build one shard"""
+    name = build_shard(payload["name"], payload["files"],
+                       lambda progress, **detail: context.report(progress, **detail),
+                       compression=payload.get("compression", VECTOR_COMPRESSION), current_job_id=context.job_id)
+    return {"shard": name, "memory": memory_report()}
+
+
+def start_shard_build(name, files, compression=VECTOR_COMPRESSION):
+    """Queue a shard build unless one of the same name is queued or running; returns the job id"""
+    if not SHARD_NAME_RE.fullmatch(name or "") or name == KB_SHARD_NAME:
+        raise ValueError("Shard names use letters, digits, '_' and '-', and cannot be 'knowledge_base'")
+    if not files:
+        raise ValueError("Pick at least one document for the shard")
+    from utils.vector_compression import parse_compression
+    parse_compression(compression)
+    queue = get_job_queue()
+    if queue.find_active("build_shard", name=name):
+        raise ValueError(f"Shard {name} is already queued or being built")
+    return queue.submit("build_shard", {"name": name, "files": list(files), "compression": compression},
+                        priority=PRIORITY_BULK)
+
+
+_shard_cache = {}
+_shard_lock = threading.Lock()
+
+
+def get_shard_stores():
+    """(name, store) for every built shard, reloaded when a shard is rebuilt"""
+    shards = []
+    with _shard_lock:
+        manifests = {shard["name"]: shard for shard in list_shards()}
+        for name in list(_shard_cache):
+            if name not in manifests:
+                del _shard_cache[name]
+        for name, manifest in manifests.items():
+            cached = _shard_cache.get(name)
+            if cached is None or cached[0] != manifest["created_at"]:
+                store = load_vector_store(os.path.join(SHARDS_DIR, name))
+                if store is None:
+                    continue
+                cached = _shard_cache[name] = (manifest["created_at"], store)
+            shards.append((name, cached[1]))
+    return shards
+
+
+def get_federated_store(extra=()):
+    """The knowledge base, every shard and any extra (name, store) pairs, searched as one store"""
+    from utils.federated_search import FederatedStore
+    return FederatedStore([(KB_SHARD_NAME, get_serving_store())] + get_shard_stores() + list(extra))
+
+
+def _file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    key = f"{os.path.basename(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _save_checkpoint(path, obj):
+    temp_file = f"{path}.tmp"
+    with open(temp_file, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(temp_file, path)
+
+
+def _load_checkpoint(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def train_on_articles(db_path=PRETRAINED_DB_PATH, progress_callback=None, files=None,
+                      compression=VECTOR_COMPRESSION, target=None):
+    """
+    Build the knowledge-base index (or a shard of the given knowledge-base files),
+    checkpointing chunks and embedded batches per file so a crashed build resumes
+    where it stopped and yields the same index. target names what is being built
+    (the knowledge base, a shard) when db_path is a fresh staging directory per attempt.
+    """
+    from langchain_community.vectorstores import FAISS
+    from utils.dedup import ChunkDeduplicator
+    from utils.embeddings import embedding_identity, save_embedding_identity
+    from utils.hierarchical_index import HierarchicalIndex
+    from utils.metadata_index import MetadataIndex
+    from utils.vector_compression import compress_store
+
+    ensure_directories()
+    files = sorted(files or (f for f in os.listdir(KNOWLEDGE_BASE_DIR) if f.lower().endswith('.pdf')))
+    fingerprints = [_file_fingerprint(os.path.join(KNOWLEDGE_BASE_DIR, f)) for f in files]
+    # Keyed by target too: a KB rebuild and a shard over the same files must not share (and delete) checkpoints
+    build_key = hashlib.sha1(json.dumps({
+        "target": target or os.path.abspath(db_path), "files": fingerprints, "embedding": embedding_identity(),
+        "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "chunking": CHUNKING_STRATEGY,
+        "batch_size": EMBED_BATCH_SIZE, "dedup": DEDUP_THRESHOLD if DEDUP_ENABLED else None
+    }).encode("utf-8")).hexdigest()[:16]
+    checkpoint_dir = os.path.join(KB_CHECKPOINT_DIR, build_key)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    embeddings = get_embedding_model()
+    text_embeddings, metadatas, ids = [], [], []
+    file_chunks = {}
+    # Shared across files so a passage repeated in another PDF is embedded once
+    deduplicator = ChunkDeduplicator(DEDUP_THRESHOLD) if DEDUP_ENABLED else None
+
+    for file_index, (filename, fingerprint) in enumerate(zip(files, fingerprints)):
+        file_dir = os.path.join(checkpoint_dir, fingerprint)
+        os.makedirs(file_dir, exist_ok=True)
+        chunks_path = os.path.join(file_dir, "chunks.pkl")
+        try:
+            if os.path.exists(chunks_path):
+                chunks = _load_checkpoint(chunks_path)
+            else:
+                # Only a file that cannot be read or parsed is skipped; embedding and checkpoint
+                # errors fail the build, and the next attempt resumes from the checkpoints kept
+                try:
+                    with stage_memory("ingest.load_and_chunk"):
+                        chunks = create_chunks(load_pdf(os.path.join(KNOWLEDGE_BASE_DIR, filename)))
+                except MemoryBudgetExceeded:
+                    raise
+                except Exception as e:
+                    print(f"Skipping {filename}, it could not be read: {str(e)}")
+                    continue
+                if not chunks:
+                    print(f"Skipping {filename}, no text could be extracted")
+                    continue
+                _save_checkpoint(chunks_path, chunks)
+            file_metadata = document_metadata(filename)
+            for chunk in chunks:
+                chunk.metadata.update(file_metadata)
+            # Signatures are only kept once the file's chunks are embedded and checkpointed
+            with deduplicator.pending() if deduplicator else nullcontext():
+                if deduplicator:
+                    chunks = deduplicator.deduplicate(chunks)
+
+                for batch_no, start in enumerate(range(0, len(chunks), EMBED_BATCH_SIZE)):
+                    batch = chunks[start:start + EMBED_BATCH_SIZE]
+                    batch_path = os.path.join(file_dir, f"batch_{batch_no:05d}.pkl")
+                    if os.path.exists(batch_path):
+                        vectors = _load_checkpoint(batch_path)
+                    else:
+                        with span("ingest.embedding"), stage_memory("ingest.embedding"):
+                            vectors = embeddings.embed_documents([chunk.page_content for chunk in batch])
+                        _save_checkpoint(batch_path, vectors)
+
+                    for offset, (chunk, vector) in enumerate(zip(batch, vectors)):
+                        text_embeddings.append((chunk.page_content, vector))
+                        metadatas.append(chunk.metadata)
+                        # Stable ids keep resumed and uninterrupted builds identical
+                        ids.append(f"{fingerprint}-{start + offset}")
+            file_chunks[filename] = len(chunks)
+        finally:
+            if progress_callback:
+                progress_callback((file_index + 1) / len(files), stage="embedding", file=filename)
+
+    if not text_embeddings:
         raise ValueError("No valid documents could be processed")
 
-    text_chunks = create_chunks(all_documents)
-    return create_vector_store(text_chunks)
+    with stage_memory("ingest.index_build"):
+        faiss_db = compact_docstore(FAISS.from_embeddings(text_embeddings, embeddings, metadatas, ids=ids))
+        faiss_db = compress_store(faiss_db, db_path, compression)
+    faiss_db.save_local(db_path)
+    save_embedding_identity(db_path, faiss_db.index.d)
+    faiss_db.metadata_index = MetadataIndex.from_faiss(faiss_db)
+    faiss_db.metadata_index.save(db_path)
+    faiss_db.hierarchy = HierarchicalIndex.from_faiss(faiss_db)
+    faiss_db.hierarchy.save(db_path)
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    # What went into the index, for validating what was written and for the manifest
+    faiss_db.build_summary = {"chunks": len(ids), "files": file_chunks}
+    return faiss_db
 
 
-def process_user_pdf(uploaded_file):
-    """Process a user-uploaded PDF and return temporary vector store"""
+def save_upload(uploaded_file):
+    """Write a Streamlit upload to USER_UPLOADS_DIR and return its path"""
+    os.makedirs(USER_UPLOADS_DIR, exist_ok=True)
     file_path = os.path.join(USER_UPLOADS_DIR, uploaded_file.name)
     with open(file_path, 'wb') as f:
         f.write(uploaded_file.getbuffer())
+    return file_path
+
+
+def process_user_pdf(uploaded_file):
+    """Process a user-uploaded PDF and return temporary vector store"""
+    from langchain_community.vectorstores import FAISS
+    file_path = save_upload(uploaded_file)
 
     documents = load_pdf(file_path)
     text_chunks = create_chunks(documents)
     embeddings = get_embedding_model()
-    return FAISS.from_documents(text_chunks, embeddings)
\ No newline at end of file
+    return compact_docstore(FAISS.from_documents(text_chunks, embeddings))
+
+
+def run_upload_index_job(payload, context):
+    """
+    Job handler (worker process): index an upload a batch of pages at a time and
+    save snapshots of the growing index that the UI process loads as they appear
+    """
+    from langchain_community.vectorstores import FAISS
+    from utils.dedup import ChunkDeduplicator
+    from utils.embeddings import save_embedding_identity
+
+    file_path, output_dir = payload["file_path"], payload["output_dir"]
+    batch_pages = payload.get("batch_pages", UPLOAD_INDEX_BATCH_PAGES)
+    embeddings = get_embedding_model()
+    total_pages, pages = open_document_pages(file_path)
+    db, snapshots, pages_done = None, [], 0
+    deduplicator = ChunkDeduplicator(DEDUP_THRESHOLD) if DEDUP_ENABLED else None
+    file_metadata = document_metadata(file_path)
+    last_snapshot_at = 0.0
+    # A retry starts over; its snapshots must not be mistaken for the failed attempt's
+    prefix = f"attempt{context.attempt}_snapshot_"
+    if os.path.isdir(output_dir):
+        for name in os.listdir(output_dir):
+            if "snapshot_" in name and not name.startswith(prefix):
+                os.remove(os.path.join(output_dir, name))
+
+    def save_snapshot():
+        name = f"{prefix}{len(snapshots)}"
+        db.save_local(output_dir, index_name=name)
+        if not snapshots:
+            save_embedding_identity(output_dir, db.index.d)
+        snapshots.append(name)
+        # Keep the previous snapshot for readers that are still loading it
+        for old in snapshots[:-2]:
+            for ext in (".faiss", ".pkl"):
+                if os.path.exists(os.path.join(output_dir, old + ext)):
+                    os.remove(os.path.join(output_dir, old + ext))
+        context.report(pages_done / total_pages if total_pages else 0.0,
+                       pages_indexed=pages_done, total_pages=total_pages, snapshot=name)
+
+    def batch_limit():
+        # Drop to one page per batch when a full batch would not fit in the memory budget
+        if fits(batch_pages * TEXT_PAGE_MB):
+            return batch_pages
+        require(TEXT_PAGE_MB, f"Indexing {os.path.basename(file_path)}")
+        return 1
+
+    batch = []
+    for page in itertools.chain(pages, [None]):  # None flushes the last batch
+        if page is not None:
+            batch.append(page)
+        if batch and (page is None or len(batch) >= batch_limit()):
+            with deduplicator.pending() if deduplicator else nullcontext():
+                with stage_memory("ingest.chunking"):
+                    chunks = create_chunks(preprocess_documents(batch))
+                    for chunk in chunks:
+                        chunk.metadata.update(file_metadata)
+                    if deduplicator:
+                        chunks = deduplicator.deduplicate(chunks)
+                if chunks:
+                    with span("ingest.embedding"), stage_memory("ingest.embedding"):
+                        if db is None:
+                            db = compact_docstore(FAISS.from_documents(chunks, embeddings))
+                        else:
+                            db.add_documents(chunks)
+            pages_done = min(pages_done + len(batch), total_pages or pages_done + len(batch))
+            batch = []
+            # First batch immediately so questions can start, then at most every interval
+            if db is not None and (not snapshots or time.time() - last_snapshot_at >= UPLOAD_SNAPSHOT_INTERVAL):
+                save_snapshot()
+                last_snapshot_at = time.time()
+
+    if db is None:
+        raise ValueError("No text could be extracted from the document")
+    pages_done = total_pages or pages_done
+    save_snapshot()
+    return {"snapshot": snapshots[-1], "pages_indexed": pages_done, "total_pages": total_pages,
+            "memory": memory_report()}
+
+
+class ProgressiveIndex:
+    """
+    Vector store for an uploaded document that a worker process fills up a batch
+    of pages at a time; searchable while it is still growing
+    """
+
+    def __init__(self, file_path, batch_pages=UPLOAD_INDEX_BATCH_PAGES):
+        self.file_path = file_path
+        self.batch_pages = batch_pages
+        self.job_id = None
+        self.output_dir = None
+        self.total_pages = 0
+        self.pages_indexed = 0
+        self.status = "pending"  # pending -> indexing -> ready | error
+        self.error = None
+        self.db = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.status == "pending":
+            self.output_dir = os.path.join(UPLOAD_INDEX_DIR, uuid.uuid4().hex)
+            self.job_id = get_job_queue().submit("index_upload", {
+                "file_path": self.file_path,
+                "output_dir": self.output_dir,
+                "batch_pages": self.batch_pages
+            }, priority=PRIORITY_INTERACTIVE)
+            self.status = "indexing"
+        return self
+
+    def refresh(self):
+        """Pick up progress and the newest index snapshot from the job"""
+        if self.job_id is None or self.status in ("ready", "error"):
+            return self
+        job = get_job_queue().get(self.job_id)
+        detail = job["result"] if job["status"] == "done" else job["detail"]
+        self.total_pages = detail.get("total_pages", self.total_pages)
+        self.pages_indexed = detail.get("pages_indexed", self.pages_indexed)
+
+        snapshot = detail.get("snapshot")
+        if snapshot and snapshot != self._snapshot:
+            from langchain_community.vectorstores import FAISS
+            from utils.embeddings import check_embedding_identity
+            try:
+                check_embedding_identity(self.output_dir)
+                db = FAISS.load_local(self.output_dir, get_embedding_model(), index_name=snapshot,
+                                      allow_dangerous_deserialization=True)
+                with self._lock:
+                    self.db, self._snapshot = db, snapshot
+            except Exception as e:
+                # The worker may have just replaced it; the next refresh loads the newer one
+                print(f"Could not load index snapshot {snapshot}: {str(e)}")
+                return self
+
+        if job["status"] == "done" and self._snapshot == snapshot:
+            self.status = "ready"
+        elif job["status"] == "failed":
+            self.status, self.error = "error", job["error"]
+        return self
+
+    @property
+    def progress(self):
+        if self.status == "ready":
+            return 1.0
+        if not self.total_pages:
+            return 0.0
+        return self.pages_indexed / self.total_pages
+
+    @property
+    def is_complete(self):
+        return self.status in ("ready", "error")
+
+    def wait_until_searchable(self, timeout=None):
+        """Poll until the first snapshot is loaded (or indexing ended); True if searchable"""
+        deadline = time.time() + timeout if timeout else None
+        while self.refresh().db is None and not self.is_complete:
+            if deadline and time.time() >= deadline:
+                break
+            time.sleep(JOB_POLL_INTERVAL)
+        return self.db is not None
+
+    def coverage_note(self):
+        """Short note for answers given before the whole document was indexed"""
+        if self.status == "ready" or not self.total_pages:
+            return ""
+        return (f"Answer based on the first {self.pages_indexed} of {self.total_pages} pages; "
+                f"the rest of the document is still being indexed.")
+
+    def similarity_search(self, query, k=4, **kwargs):
+        self.refresh()
+        with self._lock:
+            db = self.db
+        if db is None:
+            return []
+        return db.similarity_search(query, k=k, **kwargs)
+
+
+class ModelResidency:
+    """
+    Keeps the Ollama embedding model loaded: warms it up at app start, pings it with
+    keep_alive so it is not unloaded while idle, and reloads it if Ollama evicted it.
+    state is cold -> loading -> ready, or unavailable while Ollama cannot be reached.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL_NAME,
+                 keep_alive=OLLAMA_KEEP_ALIVE, interval=OLLAMA_KEEPALIVE_INTERVAL):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.state = "cold"
+        self.error = None
+        self.warmup_seconds = None
+        self.last_ping = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _request(self, path, payload=None, timeout=10):
+        import urllib.request
+
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read() or b"{}")
+
+    def is_loaded(self):
+        """Whether Ollama currently has the model in memory"""
+        models = self._request("/api/ps").get("models", [])
+        return any(self.model in (entry.get("name"), entry.get("model")) for entry in models)
+
+    def ping(self):
+        """Embed a token with keep_alive, loading the model if it is not resident"""
+        self._request("/api/embed", {"model": self.model, "input": "keep-alive", "keep_alive": self.keep_alive},
+                      timeout=OLLAMA_WARMUP_TIMEOUT)
+        self.last_ping = time.time()
+
+    def check(self):
+        """One residency cycle: reload the model if it is not resident, otherwise refresh its keep-alive"""
+        previous = self.state
+        try:
+            if self.state == "ready" and self.is_loaded():
+                self.ping()
+            else:
+                self.state = "loading"
+                self._ready.clear()
+                with span("embedding.warm_up"):
+                    start = time.perf_counter()
+                    self.ping()
+                self.warmup_seconds = round(time.perf_counter() - start, 2)
+                self.state = "ready"
+                self._ready.set()
+            self.error = None
+        except (OSError, ValueError) as e:
+            if previous != "unavailable":
+                print(f"Ollama embedding model {self.model} unavailable: {str(e)}")
+            self.state, self.error = "unavailable", str(e)
+            self._ready.clear()
+        return self.state
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            # Retry an unreachable server sooner than the keep-alive cadence
+            self._stop.wait(self.interval if self.state == "ready" else min(self.interval, 10))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ollama-residency", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def status(self):
+        return {"model": self.model, "state": self.state, "error": self.error,
+                "warmup_seconds": self.warmup_seconds, "last_ping": self.last_ping}
+
+
+_model_residency = None
+_residency_lock = threading.Lock()
+
+
+def get_model_residency():
+    """Process-wide residency manager for the Ollama embedding model, or None for in-process backends"""
+    global _model_residency
+    if EMBEDDING_BACKEND != "ollama":
+        return None
+    with _residency_lock:
+        if _model_residency is None:
+            _model_residency = ModelResidency()
+        return _model_residency